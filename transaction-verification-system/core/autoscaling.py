@@ -0,0 +1,307 @@
+import math
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Set, Tuple, Union
+from .entities import Server
+from utils.distributions import server_stream
+from utils.time_weighted import TimeWeightedValue
+
+
+class ScalingPolicy(ABC):
+    """Правило масштабирования: желаемое число серверов этапа в момент проверки"""
+
+    name = 'base'
+    # Правило по наблюдаемой нагрузке: решения сглаживаются задержками Autoscaler
+    reactive = True
+
+    @abstractmethod
+    def desired(self, scaler: 'Autoscaler', time: float) -> int:
+        """Возвращает желаемое число серверов; Autoscaler ограничивает его min/max"""
+
+
+class ThresholdPolicy(ScalingPolicy):
+    """Порог заполнения буфера: выше scale_up_at - добавить step серверов, ниже scale_down_at - убрать.
+
+    Заполнение берется средним по времени с прошлой проверки, а не мгновенным:
+    мгновенная длина короткого буфера скачет и раскачивает число серверов.
+    """
+
+    name = 'threshold'
+
+    def __init__(self, scale_up_at: float = 0.8, scale_down_at: float = 0.2, step: int = 1):
+        if scale_down_at >= scale_up_at:
+            raise ValueError("Порог уменьшения должен быть ниже порога увеличения")
+        self.scale_up_at = scale_up_at
+        self.scale_down_at = scale_down_at
+        self.step = step
+
+    def desired(self, scaler, time):
+        capacity = scaler.stage.buffer.capacity
+        occupancy = scaler.recent_buffer_length(time) / capacity if capacity > 0 else 1.0
+        if occupancy >= self.scale_up_at:
+            return scaler.capacity + self.step
+        if occupancy <= self.scale_down_at:
+            return scaler.capacity - self.step
+        return scaler.capacity
+
+
+class TargetUtilizationPolicy(ScalingPolicy):
+    """Целевая загрузка: число серверов подбирается так, чтобы загрузка за интервал была около target"""
+
+    name = 'target_utilization'
+
+    def __init__(self, target: float = 0.7, tolerance: float = 0.1):
+        if not 0 < target <= 1:
+            raise ValueError("Целевая загрузка должна лежать в (0, 1]")
+        self.target = target
+        self.tolerance = tolerance
+
+    def desired(self, scaler, time):
+        utilization = scaler.recent_utilization(time)
+        if abs(utilization - self.target) <= self.tolerance:
+            return scaler.capacity
+        desired = math.ceil(len(scaler.stage.servers) * utilization / self.target)
+        # Без серверов загрузка нулевая при любом спросе - при спросе нужен хотя бы один сервер
+        if desired == 0 and scaler.has_demand():
+            return 1
+        return desired
+
+
+class ScheduledCapacityPolicy(ScalingPolicy):
+    """Мощность по расписанию [{'time': t, 'servers': n}, ...], с period - повторяется циклически"""
+
+    name = 'scheduled'
+    reactive = False
+
+    def __init__(self, schedule: List[Dict], period: Optional[float] = None):
+        self.schedule = sorted((entry['time'], entry['servers']) for entry in schedule)
+        self.period = period
+
+    def desired(self, scaler, time):
+        if self.period:
+            time = time % self.period
+        servers = scaler.capacity
+        for start, count in self.schedule:
+            if start > time:
+                break
+            servers = count
+        return servers
+
+
+POLICIES = {
+    policy.name: policy
+    for policy in (ThresholdPolicy, TargetUtilizationPolicy, ScheduledCapacityPolicy)
+}
+
+
+def create_scaling_policy(spec: Union[str, Dict]) -> ScalingPolicy:
+    """Правило по описанию из конфигурации: имя или словарь {'type': имя, ...параметры}"""
+    if isinstance(spec, str):
+        spec = {'type': spec}
+
+    params = dict(spec)
+    name = params.pop('type')
+    if name not in POLICIES:
+        raise ValueError(f"Неизвестное правило масштабирования: {name}")
+    return POLICIES[name](**params)
+
+
+class Autoscaler:
+    """Добавляет и снимает серверы этапа по правилу масштабирования.
+
+    Новый сервер принимает заявки через startup_delay после решения, занятый
+    снимаемый сервер дорабатывает текущую заявку. После каждого решения
+    следующее принимается не раньше чем через cooldown (по умолчанию
+    5 интервалов проверки, для расписания 0), а уменьшение - только если правило требует его
+    на всех проверках последних scale_down_delay (по умолчанию 2 * cooldown).
+    Снятые серверы, запущенные масштабированием, запускаются повторно под
+    прежним id, поэтому число id и записей статистики ограничено пиком.
+    Оплачиваемое время считается от запуска сервера до его снятия, включая
+    разгон и доработку.
+    """
+
+    def __init__(self, stage, policy: ScalingPolicy, server_config: Dict, seed: Optional[int] = None,
+                 stream_prefix: str = '', min_servers: int = 1, max_servers: Optional[int] = None,
+                 startup_delay: float = 0.0, cooldown: Optional[float] = None, interval: float = 1.0,
+                 scale_down_delay: Optional[float] = None):
+        self.stage = stage
+        self.policy = policy
+        self.server_config = server_config
+        self.seed = seed
+        self.stream_prefix = stream_prefix
+        self.min_servers = min_servers
+        self.max_servers = max_servers
+        self.startup_delay = startup_delay
+        self.interval = interval
+        if cooldown is None:
+            cooldown = 5 * interval if policy.reactive else 0.0
+        self.cooldown = cooldown
+        self.scale_down_delay = 2 * self.cooldown if scale_down_delay is None else scale_down_delay
+
+        self.starting: List[Server] = []
+        self.ready_at: Dict[str, float] = {}
+        self.draining: Dict[str, Server] = {}
+        # Снятые серверы масштабирования: повторный запуск берет их с прежним id и потоком
+        self.created: Set[str] = set()
+        self.stopped: List[Server] = []
+        self.provisioned = TimeWeightedValue(initial=len(stage.servers))
+        self.next_number = len(stage.servers) + 1
+        self.last_action = -math.inf
+        self.below_since: Optional[float] = None
+        self.scale_ups = 0
+        self.scale_downs = 0
+
+        self._last_check = 0.0
+        self._last_busy_area = 0.0
+        self._last_buffer_area = 0.0
+        self._last_arrivals = 0
+
+    @property
+    def capacity(self) -> int:
+        """Серверы, которые работают или запускаются, без снимаемых"""
+        return len(self.stage.servers) - len(self.draining) + len(self.starting)
+
+    def recent_utilization(self, time: float) -> float:
+        in_service = self.stage.statistics.in_service
+        in_service.advance(time)
+        elapsed = time - self._last_check
+        servers = len(self.stage.servers)
+        if elapsed <= 0 or servers == 0:
+            return 0.0
+        return (in_service.area - self._last_busy_area) / (elapsed * servers)
+
+    def has_demand(self) -> bool:
+        """В буфере есть заявки, серверы заняты или с прошлой проверки были поступления"""
+        statistics = self.stage.statistics
+        return (len(self.stage.buffer) > 0 or any(server.is_busy for server in self.stage.servers)
+                or statistics.total_transactions > self._last_arrivals)
+
+    def recent_buffer_length(self, time: float) -> float:
+        occupancy = self.stage.statistics.buffer_occupancy
+        occupancy.advance(time)
+        elapsed = time - self._last_check
+        if elapsed <= 0:
+            return occupancy.value
+        return (occupancy.area - self._last_buffer_area) / elapsed
+
+    def check(self, time: float) -> List[Tuple[float, Server]]:
+        """Проверка правила; возвращает (момент готовности, сервер) для запущенных серверов"""
+        desired = self.policy.desired(self, time)
+        desired = max(self.min_servers, desired)
+        if self.max_servers is not None:
+            desired = min(self.max_servers, desired)
+
+        in_service = self.stage.statistics.in_service
+        in_service.advance(time)
+        occupancy = self.stage.statistics.buffer_occupancy
+        occupancy.advance(time)
+        self._last_check = time
+        self._last_busy_area = in_service.area
+        self._last_buffer_area = occupancy.area
+        self._last_arrivals = self.stage.statistics.total_transactions
+
+        if desired < self.capacity:
+            if self.below_since is None:
+                self.below_since = time
+        else:
+            self.below_since = None
+
+        if desired == self.capacity or time - self.last_action < self.cooldown:
+            return []
+        if desired < self.capacity and time - self.below_since < self.scale_down_delay:
+            return []
+
+        self.last_action = time
+        self.below_since = None
+        if desired > self.capacity:
+            return [self._start_server(time) for _ in range(desired - self.capacity)]
+
+        for _ in range(self.capacity - desired):
+            self._stop_server(time)
+        return []
+
+    def _start_server(self, time: float) -> Tuple[float, Server]:
+        if self.stopped:
+            server = self.stopped.pop()
+        else:
+            server_id = self._next_server_id()
+            server = Server(
+                server_id=server_id,
+                min_time=self.server_config['min_time'],
+                max_time=self.server_config['max_time'],
+                rng=server_stream(self.seed, self.stream_prefix + server_id)
+            )
+            self.created.add(server_id)
+        server_id = server.server_id
+        self.starting.append(server)
+        self.ready_at[server_id] = time + self.startup_delay
+        self.provisioned.add(time, 1)
+        self.scale_ups += 1
+        self.stage.statistics.record_capacity_change('SCALE_UP', server_id, self.capacity, time)
+        return time + self.startup_delay, server
+
+    def _next_server_id(self) -> str:
+        prefix = self.server_config.get('id_prefix', 'Auto')
+        while True:
+            server_id = f"{prefix}{self.next_number}"
+            self.next_number += 1
+            if server_id not in self.stage.servers_by_id:
+                return server_id
+
+    def _stop_server(self, time: float):
+        self.scale_downs += 1
+
+        # Сначала отменяются еще не запущенные серверы, затем снимаются свободные, затем занятые
+        if self.starting:
+            server = self.starting.pop()
+            del self.ready_at[server.server_id]
+            self._release(server)
+            self.provisioned.add(time, -1)
+            self.stage.statistics.record_capacity_change('SCALE_DOWN', server.server_id, self.capacity, time)
+            return
+
+        candidates = [server for server in self.stage.servers if server.server_id not in self.draining]
+        idle = [server for server in candidates if server.is_free()]
+        server = idle[-1] if idle else candidates[-1]
+        self.draining[server.server_id] = server
+        self.stage.statistics.record_capacity_change('SCALE_DOWN', server.server_id, self.capacity, time)
+        if server.is_free():
+            self.retire(server, time)
+
+    def activate(self, server_id: str, time: float) -> Optional[Server]:
+        """Сервер закончил запуск и начинает принимать заявки; None - запуск был отменен"""
+        server = next((server for server in self.starting if server.server_id == server_id), None)
+        # Событие отмененного запуска может прийти, когда id уже выдан повторно
+        if server is None or time < self.ready_at[server_id]:
+            return None
+
+        self.starting.remove(server)
+        del self.ready_at[server_id]
+        self.stage.servers.append(server)
+        self.stage.servers_by_id[server_id] = server
+        self.stage.statistics.record_capacity_change('SERVER_READY', server_id, self.capacity, time)
+        return server
+
+    def is_draining(self, server: Server) -> bool:
+        return server.server_id in self.draining
+
+    def retire(self, server: Server, time: float):
+        del self.draining[server.server_id]
+        self.stage.servers.remove(server)
+        del self.stage.servers_by_id[server.server_id]
+        self._release(server)
+        self.provisioned.add(time, -1)
+        self.stage.statistics.record_capacity_change('SERVER_STOPPED', server.server_id, self.capacity, time)
+
+    def _release(self, server: Server):
+        if server.server_id in self.created:
+            self.stopped.append(server)
+
+    def get_summary(self, end_time: float) -> Dict:
+        mean = self.provisioned.mean(end_time)
+        return {
+            'server_time': self.provisioned.area,
+            'avg_servers': mean,
+            'peak_servers': int(max(max(self.provisioned.durations, default=0), self.provisioned.value)),
+            'scale_ups': self.scale_ups,
+            'scale_downs': self.scale_downs
+        }
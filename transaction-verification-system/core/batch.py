@@ -0,0 +1,240 @@
+import math
+import secrets
+from statistics import NormalDist
+from typing import Dict, Optional
+from .buffer import RejectNewPolicy, create_policy
+from .entities import source_priority
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class BatchSimulation:
+    """Пакетный движок: R независимых реплик модели в массивах NumPy.
+
+    Реплики продвигаются синхронно: на каждом шаге каждая реплика обрабатывает
+    свое ближайшее событие. Дисциплины Д10З2/Д10О5/Д2П1/Д2Б5 повторяют
+    DispatcherIn и DispatcherOut.
+    """
+
+    def __init__(self, config: Dict, replicas: int, seed: Optional[int] = None):
+        if np is None:
+            raise ImportError("Для пакетного режима требуется numpy")
+        if 'stages' in config:
+            raise ValueError("Пакетный режим поддерживает только одноэтапную модель")
+        if create_policy(config.get('buffer_policy')).name != RejectNewPolicy.name:
+            raise ValueError("Пакетный режим поддерживает только политику буфера reject_new (Д10О5)")
+        if 'autoscaling' in config:
+            raise ValueError("Пакетный режим не поддерживает автомасштабирование")
+
+        self.config = config
+        self.replicas = replicas
+        self.simulation_time = config['simulation_time']
+        # Без явного зерна берется случайное и сохраняется для воспроизведения
+        self.seed = secrets.randbits(63) if seed is None else seed
+        self.rng = np.random.default_rng(self.seed)
+
+        self.source_ids = [s['id'] for s in config['sources']]
+        self.server_ids = [s['id'] for s in config['servers']]
+        self.lambdas = np.array([s['lambda'] for s in config['sources']], dtype=float)
+        self.min_times = np.array([s['min_time'] for s in config['servers']], dtype=float)
+        self.max_times = np.array([s['max_time'] for s in config['servers']], dtype=float)
+        self.capacity = config['buffer_capacity']
+
+        # Тот же порядок приоритета, что и в DispatcherOut.select_packet
+        order = sorted(range(len(self.source_ids)),
+                       key=lambda i: (source_priority(self.source_ids[i]), self.source_ids[i]))
+        self.priority_rank = np.empty(len(order), dtype=np.int64)
+        self.priority_rank[order] = np.arange(len(order))
+
+        R, S, K, C = replicas, len(self.source_ids), len(self.server_ids), max(self.capacity, 1)
+        self.current_time = np.zeros(R)
+
+        self.next_arrival = self._exponential((R, S))
+        self.server_busy = np.zeros((R, K), dtype=bool)
+        self.server_end = np.full((R, K), np.inf)
+        self.server_start = np.zeros((R, K))
+        self.server_timestamp = np.zeros((R, K))
+        self.server_source = np.zeros((R, K), dtype=np.int64)
+
+        self.buffer_source = np.zeros((R, C), dtype=np.int64)
+        self.buffer_timestamp = np.zeros((R, C))
+        self.buffer_length = np.zeros(R, dtype=np.int64)
+
+        self.packet_source = np.zeros((R, C), dtype=np.int64)
+        self.packet_timestamp = np.zeros((R, C))
+        self.packet_length = np.zeros(R, dtype=np.int64)
+        self.packet_head = np.zeros(R, dtype=np.int64)
+
+        self.generated = np.zeros((R, S), dtype=np.int64)
+        self.rejected = np.zeros((R, S), dtype=np.int64)
+        self.completed = np.zeros((R, S), dtype=np.int64)
+        self.total_wait_time = np.zeros((R, S))
+        self.total_service_time = np.zeros((R, S))
+        self.total_system_time = np.zeros((R, S))
+        self.busy_time = np.zeros((R, K))
+        self.processed = np.zeros((R, K), dtype=np.int64)
+        self.packets_formed = np.zeros(R, dtype=np.int64)
+        self.events_processed = 0
+
+    def _exponential(self, shape) -> 'np.ndarray':
+        with np.errstate(divide='ignore'):
+            scale = np.where(self.lambdas > 0, 1.0 / self.lambdas, np.inf)
+        return self.rng.exponential(1.0, size=shape) * scale
+
+    def run(self):
+        rows = np.arange(self.replicas)
+
+        while True:
+            source_idx = self.next_arrival.argmin(axis=1)
+            arrival_time = self.next_arrival[rows, source_idx]
+            server_idx = self.server_end.argmin(axis=1)
+            end_time = self.server_end[rows, server_idx]
+
+            is_arrival = arrival_time <= end_time
+            time = np.where(is_arrival, arrival_time, end_time)
+            active = time < self.simulation_time
+            if not active.any():
+                break
+
+            self.current_time[active] = time[active]
+            self.events_processed += int(active.sum())
+
+            arrivals = np.nonzero(active & is_arrival)[0]
+            if arrivals.size:
+                self._handle_arrivals(arrivals, source_idx[arrivals], time[arrivals])
+
+            completions = np.nonzero(active & ~is_arrival)[0]
+            if completions.size:
+                self._handle_completions(completions, server_idx[completions], time[completions])
+
+        self.current_time[:] = self.simulation_time
+
+    def _handle_arrivals(self, r, s, t):
+        self.generated[r, s] += 1
+        self.next_arrival[r, s] = t + self.rng.exponential(1.0, size=r.size) / self.lambdas[s]
+
+        # Д2П1: первый свободный сервер по номеру
+        free = ~self.server_busy[r]
+        has_free = free.any(axis=1)
+        direct = r[has_free]
+        if direct.size:
+            self._start_service(direct, free[has_free].argmax(axis=1), s[has_free], t[has_free], t[has_free])
+
+        queued, s, t = r[~has_free], s[~has_free], t[~has_free]
+        room = self.buffer_length[queued] < self.capacity
+
+        # Д10З2: постановка в конец буфера
+        accepted = queued[room]
+        position = self.buffer_length[accepted]
+        self.buffer_source[accepted, position] = s[room]
+        self.buffer_timestamp[accepted, position] = t[room]
+        self.buffer_length[accepted] += 1
+
+        # Д10О5: отказ вновь пришедшей заявке
+        self.rejected[queued[~room], s[~room]] += 1
+
+    def _handle_completions(self, r, k, t):
+        source = self.server_source[r, k]
+        service_time = t - self.server_start[r, k]
+
+        self.busy_time[r, k] += service_time
+        self.processed[r, k] += 1
+        self.completed[r, source] += 1
+        self.total_service_time[r, source] += service_time
+        self.total_system_time[r, source] += t - self.server_timestamp[r, k]
+
+        self.server_busy[r, k] = False
+        self.server_end[r, k] = np.inf
+
+        # Продолжение текущего пакета
+        has_packet = self.packet_head[r] < self.packet_length[r]
+        continuing = r[has_packet]
+        if continuing.size:
+            self._start_from_packet(continuing, k[has_packet], t[has_packet])
+
+        # Д2Б5: формирование нового пакета от самого приоритетного источника
+        forming = ~has_packet & (self.buffer_length[r] > 0)
+        if forming.any():
+            self._form_packets(r[forming])
+            self._start_from_packet(r[forming], k[forming], t[forming])
+
+    def _form_packets(self, r):
+        valid = np.arange(self.buffer_source.shape[1]) < self.buffer_length[r][:, None]
+        rank = np.where(valid, self.priority_rank[self.buffer_source[r]], np.iinfo(np.int64).max)
+        chosen = valid & (rank == rank.min(axis=1)[:, None])
+
+        # Стабильная сортировка сохраняет порядок поступления внутри пакета и в буфере
+        packet_order = np.argsort(~chosen, axis=1, kind='stable')
+        remaining_order = np.argsort(~(valid & ~chosen), axis=1, kind='stable')
+        sources, timestamps = self.buffer_source[r], self.buffer_timestamp[r]
+
+        self.packet_source[r] = np.take_along_axis(sources, packet_order, axis=1)
+        self.packet_timestamp[r] = np.take_along_axis(timestamps, packet_order, axis=1)
+        self.packet_length[r] = chosen.sum(axis=1)
+        self.packet_head[r] = 0
+
+        self.buffer_source[r] = np.take_along_axis(sources, remaining_order, axis=1)
+        self.buffer_timestamp[r] = np.take_along_axis(timestamps, remaining_order, axis=1)
+        self.buffer_length[r] -= self.packet_length[r]
+        self.packets_formed[r] += 1
+
+    def _start_from_packet(self, r, k, t):
+        head = self.packet_head[r]
+        source = self.packet_source[r, head]
+        timestamp = self.packet_timestamp[r, head]
+        self.packet_head[r] += 1
+
+        self.total_wait_time[r, source] += t - timestamp
+        self._start_service(r, k, source, timestamp, t)
+
+    def _start_service(self, r, k, source, timestamp, t):
+        self.server_busy[r, k] = True
+        self.server_start[r, k] = t
+        self.server_timestamp[r, k] = timestamp
+        self.server_source[r, k] = source
+        self.server_end[r, k] = t + self.rng.uniform(self.min_times[k], self.max_times[k])
+
+    def get_rejection_rates(self) -> 'np.ndarray':
+        generated = self.generated.sum(axis=1)
+        return np.divide(self.rejected.sum(axis=1), generated,
+                         out=np.zeros(self.replicas), where=generated > 0)
+
+    def get_results(self, confidence: float = 0.9) -> Dict:
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+        def summarize(values):
+            mean = float(values.mean())
+            std = float(values.std(ddof=1)) if values.size > 1 else 0.0
+            return {'mean': mean, 'std': std, 'half_width': z * std / math.sqrt(values.size)}
+
+        def ratio(numerator, denominator):
+            return np.divide(numerator, denominator, out=np.zeros(numerator.shape, dtype=float),
+                             where=denominator > 0)
+
+        return {
+            'replicas': self.replicas,
+            'seed': self.seed,
+            'simulation_time': self.simulation_time,
+            'events_processed': self.events_processed,
+            'rejection_rate': summarize(self.get_rejection_rates()),
+            'source_statistics': {
+                source_id: {
+                    'generated': summarize(self.generated[:, i].astype(float)),
+                    'rejection_rate': summarize(ratio(self.rejected[:, i], self.generated[:, i])),
+                    'avg_system_time': summarize(ratio(self.total_system_time[:, i], self.completed[:, i])),
+                    'avg_wait_time': summarize(ratio(self.total_wait_time[:, i], self.completed[:, i])),
+                    'avg_service_time': summarize(ratio(self.total_service_time[:, i], self.completed[:, i]))
+                }
+                for i, source_id in enumerate(self.source_ids)
+            },
+            'server_statistics': {
+                server_id: {
+                    'processed': summarize(self.processed[:, k].astype(float)),
+                    'utilization': summarize(self.busy_time[:, k] / self.simulation_time)
+                }
+                for k, server_id in enumerate(self.server_ids)
+            }
+        }
@@ -1,41 +1,208 @@
+import heapq
+from abc import ABC, abstractmethod
 from collections import deque
-from typing import List
-from .entities import Transaction
+from typing import Dict, List, Optional, Tuple, Union
+from .entities import Transaction, source_priority
+
+
+class AdmissionPolicy(ABC):
+    """Дисциплина постановки в полный буфер: принять ли заявку и кого вытеснить"""
+
+    name = 'base'
+
+    @abstractmethod
+    def admit(self, buffer: 'Buffer', transaction: Transaction) -> Tuple[bool, Optional[Transaction]]:
+        """Возвращает (принять ли заявку, вытесняемая заявка или None)"""
+
+
+class RejectNewPolicy(AdmissionPolicy):
+    """Д10О5: отказ вновь пришедшей заявке"""
+
+    name = 'reject_new'
+
+    def admit(self, buffer, transaction):
+        return not buffer.is_full(), None
+
+
+class DropOldestPolicy(AdmissionPolicy):
+    """Вытеснение самой старой заявки в буфере"""
+
+    name = 'drop_oldest'
+
+    def admit(self, buffer, transaction):
+        if not buffer.is_full():
+            return True, None
+        if buffer.is_empty():
+            return False, None
+        return True, buffer.oldest()
+
+
+class PushOutLowestPriorityPolicy(AdmissionPolicy):
+    """Вытеснение последней заявки самого неприоритетного источника, если он ниже пришедшего"""
+
+    name = 'push_out_lowest_priority'
+
+    def admit(self, buffer, transaction):
+        if not buffer.is_full():
+            return True, None
+
+        lowest = buffer.lowest_priority_source()
+        if lowest is None or source_priority(lowest) <= source_priority(transaction.source_id):
+            return False, None
+        return True, buffer.newest(lowest)
+
+
+class SourceQuotaPolicy(AdmissionPolicy):
+    """Квоты мест на источник и зарезервированные места, недоступные другим источникам"""
+
+    name = 'source_quota'
+
+    def __init__(self, quotas: Optional[Dict[str, int]] = None, reserved: Optional[Dict[str, int]] = None):
+        self.quotas = quotas or {}
+        self.reserved = reserved or {}
+
+    def admit(self, buffer, transaction):
+        source_id = transaction.source_id
+        count = buffer.count_by_source(source_id)
+
+        quota = self.quotas.get(source_id)
+        if quota is not None and count >= quota:
+            return False, None
+
+        # Незанятые резервы других источников вычитаются из доступной емкости
+        unmet = sum(max(0, slots - buffer.count_by_source(other))
+                    for other, slots in self.reserved.items() if other != source_id)
+        return len(buffer) < buffer.capacity - unmet, None
+
+
+POLICIES = {
+    policy.name: policy
+    for policy in (RejectNewPolicy, DropOldestPolicy, PushOutLowestPriorityPolicy, SourceQuotaPolicy)
+}
+
+
+def create_policy(spec: Union[None, str, Dict]) -> AdmissionPolicy:
+    """Политика по описанию из конфигурации: имя или словарь {'type': имя, ...параметры}"""
+    if spec is None:
+        return RejectNewPolicy()
+    if isinstance(spec, str):
+        spec = {'type': spec}
+
+    params = dict(spec)
+    name = params.pop('type')
+    if name not in POLICIES:
+        raise ValueError(f"Неизвестная политика буфера: {name}")
+    return POLICIES[name](**params)
 
 
 class Buffer:
-    def __init__(self, capacity: int):
+    def __init__(self, capacity: int, policy: Optional[AdmissionPolicy] = None):
         self.capacity = capacity
-        self.queue = deque()
+        self.policy = policy or RejectNewPolicy()
+
+        # Номер постановки -> заявка; порядок словаря совпадает с порядком поступления (Д10З2)
+        self.entries: Dict[int, Transaction] = {}
+        self.by_source: Dict[str, Dict[int, Transaction]] = {}
+        self._order = deque()
+        self._lowest_heap: List[Tuple[int, str]] = []
+        self._in_heap = set()
+        self._seq = 0
+        self._positions: Dict[str, int] = {}
+
+    @property
+    def queue(self) -> List[Transaction]:
+        return list(self.entries.values())
+
+    def __len__(self) -> int:
+        return len(self.entries)
 
     def add_transaction(self, transaction: Transaction) -> bool:
-        if len(self.queue) < self.capacity:
-            self.queue.append(transaction)
-            return True
-        return False
+        return self.offer(transaction)[0]
+
+    def offer(self, transaction: Transaction) -> Tuple[bool, Optional[Transaction]]:
+        """Постановка по политике; возвращает (принята ли заявка, вытесненная заявка)"""
+        accepted, displaced = self.policy.admit(self, transaction)
+        if not accepted:
+            return False, None
+
+        if displaced is not None:
+            self._remove(displaced)
+        self._append(transaction)
+        return True, displaced
+
+    def _append(self, transaction: Transaction):
+        seq = self._seq
+        self._seq += 1
+
+        self.entries[seq] = transaction
+        self._positions[transaction.id] = seq
+        self._order.append(seq)
+        if len(self._order) > 2 * len(self.entries) + self.capacity:
+            # Номера вынутых заявок копятся в середине очереди - перестраиваем ее
+            self._order = deque(self.entries)
+
+        source_entries = self.by_source.get(transaction.source_id)
+        if source_entries is None:
+            source_entries = self.by_source[transaction.source_id] = {}
+            if transaction.source_id not in self._in_heap:
+                self._in_heap.add(transaction.source_id)
+                heapq.heappush(self._lowest_heap, (-source_priority(transaction.source_id), transaction.source_id))
+        source_entries[seq] = transaction
+
+    def _remove(self, transaction: Transaction):
+        seq = self._positions.pop(transaction.id)
+        del self.entries[seq]
+
+        source_entries = self.by_source[transaction.source_id]
+        del source_entries[seq]
+        if not source_entries:
+            del self.by_source[transaction.source_id]
+
+    def oldest(self) -> Optional[Transaction]:
+        # Ленивое удаление: номера вынутых заявок отбрасываются при просмотре
+        while self._order and self._order[0] not in self.entries:
+            self._order.popleft()
+        return self.entries[self._order[0]] if self._order else None
+
+    def pop_oldest(self) -> Optional[Transaction]:
+        transaction = self.oldest()
+        if transaction is not None:
+            self._remove(transaction)
+        return transaction
+
+    def newest(self, source_id: str) -> Optional[Transaction]:
+        source_entries = self.by_source.get(source_id)
+        if not source_entries:
+            return None
+        return source_entries[next(reversed(source_entries))]
+
+    def lowest_priority_source(self) -> Optional[str]:
+        while self._lowest_heap:
+            _, source_id = self._lowest_heap[0]
+            if source_id in self.by_source:
+                return source_id
+            heapq.heappop(self._lowest_heap)
+            self._in_heap.discard(source_id)
+        return None
+
+    def count_by_source(self, source_id: str) -> int:
+        return len(self.by_source.get(source_id, ()))
 
     def get_transactions_by_source(self, source_id: str) -> List[Transaction]:
-        return [t for t in self.queue if t.source_id == source_id]
+        return list(self.by_source.get(source_id, {}).values())
 
     def remove_transactions_by_source(self, source_id: str) -> List[Transaction]:
-        removed = []
-        remaining = []
-        for t in self.queue:
-            if t.source_id == source_id:
-                removed.append(t)
-            else:
-                remaining.append(t)
-        self.queue = deque(remaining)
-        return removed
+        source_entries = self.by_source.pop(source_id, {})
+        for seq, transaction in source_entries.items():
+            del self.entries[seq]
+            del self._positions[transaction.id]
+        return list(source_entries.values())
 
     def get_all_sources(self) -> List[str]:
-        sources = set()
-        for t in self.queue:
-            sources.add(t.source_id)
-        return list(sources)
+        return list(self.by_source)
 
     def is_full(self) -> bool:
-        return len(self.queue) >= self.capacity
+        return len(self.entries) >= self.capacity
 
     def is_empty(self) -> bool:
-        return len(self.queue) == 0
+        return len(self.entries) == 0
@@ -1,5 +1,5 @@
 from typing import List, Optional, Tuple
-from .entities import Transaction, Server
+from .entities import Transaction, Server, source_priority
 from .buffer import Buffer
 from .statistics import Statistics
 
@@ -30,8 +30,16 @@ class DispatcherIn:
 
             return 'served', end_time, free_server.server_id
         else:
-            if self.buffer.add_transaction(transaction):
+            accepted, displaced = self.buffer.offer(transaction)
+            if accepted:
+                if displaced is not None:
+                    self.statistics.record_displacement(displaced, transaction, transaction.timestamp)
+
+                    if self.verbose:
+                        print(f"[ВЫТЕСНЕНИЕ] Транзакция {displaced.id} вытеснена транзакцией {transaction.id}")
+
                 self.statistics.record_buffer_entry(transaction, transaction.timestamp)
+                self.statistics.record_buffer_level(len(self.buffer), transaction.timestamp)
 
                 if self.verbose:
                     print(f"[БУФЕР] Транзакция {transaction.id} добавлена в буфер")
@@ -83,6 +91,8 @@ class DispatcherOut:
         if not packet:
             return []
 
+        self.statistics.record_buffer_level(len(self.buffer), current_time)
+
         self.current_packet = packet
         self.current_packet_source = packet[0].source_id
         self.active_packet_processing = True
@@ -111,7 +121,7 @@ class DispatcherOut:
         if not sources_in_buffer:
             return []
 
-        priority_order = sorted(sources_in_buffer, key=lambda x: (int(x[1:]) if x[1:].isdigit() else 999))
+        priority_order = sorted(sources_in_buffer, key=source_priority)
 
         for source in priority_order:
             if source in sources_in_buffer:
@@ -119,3 +129,27 @@ class DispatcherOut:
                 return packet
 
         return []
+
+
+class FifoDispatcherOut(DispatcherOut):
+    """Выбор заявки строго в порядке поступления, без пакетов"""
+
+    def on_server_free(self, server: Server, current_time: float) -> List[Tuple[float, str]]:
+        transaction = self.buffer.pop_oldest()
+        if transaction is None:
+            return []
+
+        self.statistics.record_buffer_level(len(self.buffer), current_time)
+        end_time = server.process_transaction(transaction, current_time)
+        self.statistics.record_service_start(transaction, current_time, server.server_id)
+
+        if self.verbose:
+            print(f"[FIFO] Транзакция {transaction.id} → сервер {server.server_id}")
+
+        return [(end_time, server.server_id)]
+
+
+DISPATCHERS_OUT = {
+    'priority_packets': DispatcherOut,
+    'fifo': FifoDispatcherOut
+}
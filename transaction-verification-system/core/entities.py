@@ -1,6 +1,12 @@
 import random
 from dataclasses import dataclass
 from typing import Optional
+from utils.distributions import exponential
+
+
+def source_priority(source_id: str) -> int:
+    """Приоритет источника по номеру (Д2Б5): меньше номер - выше приоритет"""
+    return int(source_id[1:]) if source_id[1:].isdigit() else 999
 
 
 @dataclass
@@ -12,12 +18,17 @@ class Transaction:
 
 
 class PaymentSource:
-    def __init__(self, source_id: str, priority: int, lambda_param: float):
+    def __init__(self, source_id: str, priority: int, lambda_param: float,
+                 rng: Optional[random.Random] = None):
         self.source_id = source_id
         self.priority = priority
         self.lambda_param = lambda_param
+        self.rng = rng
         self.generated_count = 0
 
+    def next_interarrival(self) -> float:
+        return exponential(self.lambda_param, self.rng)
+
     def generate_transaction(self, current_time: float) -> Transaction:
         self.generated_count += 1
         return Transaction(
@@ -28,12 +39,14 @@ class PaymentSource:
 
 
 class Server:
-    def __init__(self, server_id: str, min_time: float, max_time: float):
+    def __init__(self, server_id: str, min_time: float, max_time: float, rng: Optional[random.Random] = None):
         self.server_id = server_id
         self.min_process_time = min_time
         self.max_process_time = max_time
+        self.rng = rng
         self.is_busy = False
         self.current_transaction: Optional[Transaction] = None
+        self.current_start_time = 0.0
 
     def is_free(self) -> bool:
         return not self.is_busy
@@ -41,7 +54,8 @@ class Server:
     def process_transaction(self, transaction: Transaction, current_time: float) -> float:
         self.is_busy = True
         self.current_transaction = transaction
-        process_time = random.uniform(self.min_process_time, self.max_process_time)
+        self.current_start_time = current_time
+        process_time = (self.rng or random).uniform(self.min_process_time, self.max_process_time)
         return current_time + process_time
 
     def complete_processing(self):
@@ -0,0 +1,211 @@
+import gzip
+import json
+import math
+from typing import Callable, Dict, List, Optional
+from .simulation import Simulation
+
+TRACE_VERSION = 1
+
+# Поля события в каноническом порядке; отсутствующие поля записываются как None
+TRACE_FIELDS = ('type', 'time', 'transaction_id', 'source_id', 'server_id', 'packet_size')
+
+SCENARIOS: Dict[str, Dict] = {
+    'baseline': {
+        'seed': 1,
+        'config': {
+            'simulation_time': 300.0,
+            'buffer_capacity': 5,
+            'sources': [
+                {'id': 'S1', 'priority': 1, 'lambda': 0.5},
+                {'id': 'S2', 'priority': 2, 'lambda': 0.4},
+                {'id': 'S3', 'priority': 3, 'lambda': 0.3}
+            ],
+            'servers': [
+                {'id': 'Server1', 'min_time': 1.0, 'max_time': 3.0},
+                {'id': 'Server2', 'min_time': 2.0, 'max_time': 4.0},
+                {'id': 'Server3', 'min_time': 1.0, 'max_time': 3.0}
+            ]
+        }
+    },
+    'overload': {
+        'seed': 2,
+        'config': {
+            'simulation_time': 200.0,
+            'buffer_capacity': 3,
+            'sources': [
+                {'id': 'S1', 'priority': 1, 'lambda': 1.2},
+                {'id': 'S2', 'priority': 2, 'lambda': 1.0},
+                {'id': 'S3', 'priority': 3, 'lambda': 0.8}
+            ],
+            'servers': [
+                {'id': 'Server1', 'min_time': 1.0, 'max_time': 3.0},
+                {'id': 'Server2', 'min_time': 2.0, 'max_time': 4.0}
+            ]
+        }
+    },
+    'underload': {
+        'seed': 3,
+        'config': {
+            'simulation_time': 500.0,
+            'buffer_capacity': 10,
+            'sources': [
+                {'id': 'S1', 'priority': 1, 'lambda': 0.1},
+                {'id': 'S2', 'priority': 2, 'lambda': 0.1}
+            ],
+            'servers': [
+                {'id': 'Server1', 'min_time': 1.0, 'max_time': 3.0},
+                {'id': 'Server2', 'min_time': 1.0, 'max_time': 3.0},
+                {'id': 'Server3', 'min_time': 1.0, 'max_time': 3.0}
+            ]
+        }
+    },
+    'packets': {
+        'seed': 4,
+        'config': {
+            'simulation_time': 300.0,
+            'buffer_capacity': 12,
+            'sources': [{'id': f'S{i}', 'priority': i, 'lambda': 0.15} for i in range(1, 9)],
+            'servers': [
+                {'id': 'Server1', 'min_time': 2.0, 'max_time': 6.0},
+                {'id': 'Server2', 'min_time': 2.0, 'max_time': 6.0}
+            ]
+        }
+    },
+    'single_slot': {
+        'seed': 5,
+        'config': {
+            'simulation_time': 300.0,
+            'buffer_capacity': 1,
+            'sources': [
+                {'id': 'S1', 'priority': 1, 'lambda': 0.6},
+                {'id': 'S2', 'priority': 2, 'lambda': 0.6}
+            ],
+            'servers': [
+                {'id': 'Server1', 'min_time': 0.5, 'max_time': 2.5}
+            ]
+        }
+    }
+}
+
+
+def run_sequential(config: Dict, seed: int) -> Simulation:
+    sim = Simulation(config, verbose=False, seed=seed)
+    sim.running = True
+    while sim.run_step():
+        pass
+    return sim
+
+
+def run_parallel(config: Dict, seed: int) -> Simulation:
+    from .parallel import ParallelSimulation
+
+    sim = ParallelSimulation(config, seed=seed, workers=2)
+    sim.run()
+    return sim
+
+
+ENGINES: Dict[str, Callable[[Dict, int], Simulation]] = {
+    'sequential': run_sequential,
+    'parallel': run_parallel
+}
+
+
+def canonical_events(sim: Simulation) -> List[List]:
+    return [[event.get(field) for field in TRACE_FIELDS] for event in sim.statistics.event_history]
+
+
+def final_statistics(sim: Simulation) -> Dict:
+    statistics = sim.statistics
+    return {
+        'time': sim.current_time,
+        'summary': statistics.get_summary(),
+        'sources': {source_id: statistics.get_source_statistics(source_id)
+                    for source_id in sorted(statistics.source_stats)},
+        'servers': {server_id: statistics.get_server_statistics(server_id, sim.current_time)
+                    for server_id in sorted(statistics.server_stats)}
+    }
+
+
+def record(engine: Callable[[Dict, int], Simulation], scenarios: Optional[Dict[str, Dict]] = None) -> Dict:
+    scenarios = SCENARIOS if scenarios is None else scenarios
+    traces = {}
+    for name, scenario in scenarios.items():
+        sim = engine(scenario['config'], scenario['seed'])
+        traces[name] = {
+            'seed': scenario['seed'],
+            'config': scenario['config'],
+            'events': canonical_events(sim),
+            'statistics': final_statistics(sim)
+        }
+    return {'version': TRACE_VERSION, 'fields': list(TRACE_FIELDS), 'scenarios': traces}
+
+
+def save(golden: Dict, path: str):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt') as f:
+        json.dump(golden, f, separators=(',', ':'))
+
+
+def load(path: str) -> Dict:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        golden = json.load(f)
+    if golden.get('version') != TRACE_VERSION:
+        raise ValueError(f"Неподдерживаемая версия трассы: {golden.get('version')}")
+    return golden
+
+
+def _values_equal(expected, actual, tolerance: float) -> bool:
+    if isinstance(expected, float) or isinstance(actual, float):
+        if expected is None or actual is None:
+            return expected is actual
+        return math.isclose(expected, actual, rel_tol=tolerance, abs_tol=tolerance)
+    return expected == actual
+
+
+def _first_difference(expected, actual, tolerance: float, path: str = '') -> Optional[str]:
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected) | set(actual), key=str):
+            if key not in expected or key not in actual:
+                return f"{path}{key}: ключ есть только в одной из версий"
+            difference = _first_difference(expected[key], actual[key], tolerance, f"{path}{key}.")
+            if difference:
+                return difference
+        return None
+    if not _values_equal(expected, actual, tolerance):
+        return f"{path[:-1]}: ожидалось {expected!r}, получено {actual!r}"
+    return None
+
+
+def compare(golden: Dict, engine: Callable[[Dict, int], Simulation], tolerance: float = 0.0) -> Dict:
+    """Прогоняет сценарии эталона на движке и находит первое расхождение в каждом"""
+    report = {}
+    for name, scenario in golden['scenarios'].items():
+        sim = engine(scenario['config'], scenario['seed'])
+        events = canonical_events(sim)
+        expected_events = scenario['events']
+
+        divergence = None
+        for index, (expected, actual) in enumerate(zip(expected_events, events)):
+            if not all(_values_equal(e, a, tolerance) for e, a in zip(expected, actual)):
+                divergence = {'index': index, 'expected': expected, 'actual': actual}
+                break
+        if divergence is None and len(expected_events) != len(events):
+            index = min(len(expected_events), len(events))
+            divergence = {
+                'index': index,
+                'expected': expected_events[index] if index < len(expected_events) else None,
+                'actual': events[index] if index < len(events) else None
+            }
+
+        statistics_difference = _first_difference(
+            scenario['statistics'], json.loads(json.dumps(final_statistics(sim))), tolerance)
+
+        report[name] = {
+            'events': len(events),
+            'expected_events': len(expected_events),
+            'divergence': divergence,
+            'statistics_difference': statistics_difference,
+            'passed': divergence is None and statistics_difference is None
+        }
+    return report
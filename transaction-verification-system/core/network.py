@@ -0,0 +1,68 @@
+import random
+from typing import Dict, List, Optional, Tuple
+from .buffer import Buffer
+from .dispatchers import DISPATCHERS_OUT, DispatcherIn
+from .entities import Server
+from .statistics import Statistics
+
+
+class Stage:
+    """Этап проверки: свой буфер, серверы, дисциплина выбора заявки и маршрутизация дальше"""
+
+    def __init__(self, stage_id: str, buffer: Buffer, servers: List[Server], statistics: Statistics,
+                 dispatcher: str = 'priority_packets', verbose: bool = True,
+                 rng: Optional[random.Random] = None, stream_prefix: str = ''):
+        if dispatcher not in DISPATCHERS_OUT:
+            raise ValueError(f"Неизвестная дисциплина выбора заявки: {dispatcher}")
+
+        self.stage_id = stage_id
+        self.buffer = buffer
+        self.servers = servers
+        self.servers_by_id = {server.server_id: server for server in servers}
+        self.statistics = statistics
+        self.dispatcher_in = DispatcherIn(buffer, servers, statistics, verbose)
+        self.dispatcher_out = DISPATCHERS_OUT[dispatcher](buffer, servers, statistics, verbose)
+
+        # (индекс следующего этапа, вероятность); остаток вероятности - выход из сети
+        self.routing: List[Tuple[int, float]] = []
+        self.rng = rng
+        # Префикс потоков случайных чисел серверов этапа
+        self.stream_prefix = stream_prefix
+        self.autoscaler = None
+
+    def server_ids(self) -> List[str]:
+        """Текущие серверы и серверы, снятые автомасштабированием после работы"""
+        current = [server.server_id for server in self.servers]
+        return current + [server_id for server_id in self.statistics.server_stats if server_id not in current]
+
+    def route(self) -> Optional[int]:
+        if not self.routing:
+            return None
+
+        u = (self.rng or random).random()
+        cumulative = 0.0
+        for target, probability in self.routing:
+            cumulative += probability
+            if u < cumulative:
+                return target
+        return None
+
+    def get_summary(self, total_time: float) -> Dict:
+        statistics = self.statistics
+        completed = sum(stats['completed'] for stats in statistics.source_stats.values())
+        total_wait = sum(stats['total_wait_time'] for stats in statistics.source_stats.values())
+        utilization = {
+            server_id: statistics.get_server_statistics(server_id, total_time)['utilization']
+            for server_id in self.server_ids()
+        }
+
+        return {
+            'arrivals': statistics.total_transactions,
+            'rejected': statistics.rejected_transactions,
+            'rejection_rate': statistics.get_rejection_rate(),
+            'completed': completed,
+            'avg_wait_time': total_wait / completed if completed > 0 else 0.0,
+            'avg_buffer_length': statistics.buffer_occupancy.mean(total_time),
+            'utilization': utilization,
+            'max_utilization': max(utilization.values(), default=0.0)
+        }
@@ -0,0 +1,174 @@
+import heapq
+import multiprocessing
+import queue as queue_module
+import traceback
+from array import array
+from typing import Dict, List, Optional, Tuple
+from .simulation import Event, Simulation
+from utils.distributions import Seed, exponential, source_stream
+
+
+def window_end(index: int, lookahead: float, simulation_time: float) -> float:
+    return min((index + 1) * lookahead, simulation_time)
+
+
+def generate_arrivals(sources: List[Tuple[int, str, float]], seed: Seed, simulation_time: float,
+                      lookahead: float, queue):
+    """Рабочий процесс: генерирует поступления своих источников окнами длины lookahead.
+
+    Каждое окно - пара массивов (времена, индексы источников), упорядоченная по
+    времени. Исключение передается центральному процессу строкой с трассировкой.
+    """
+    try:
+        rngs = [source_stream(seed, source_id) for _, source_id, _ in sources]
+        # Та же арифметика, что и в Simulation._schedule_next_arrival: t + delay
+        next_times = [0.0 + exponential(lam, rng) for (_, _, lam), rng in zip(sources, rngs)]
+
+        index = 0
+        while True:
+            end = window_end(index, lookahead, simulation_time)
+            batch = []
+            for j, (source_index, _, lam) in enumerate(sources):
+                while next_times[j] < end:
+                    batch.append((next_times[j], source_index))
+                    next_times[j] = next_times[j] + exponential(lam, rngs[j])
+            batch.sort()
+
+            queue.put((array('d', (t for t, _ in batch)), array('i', (i for _, i in batch))))
+            if end >= simulation_time:
+                break
+            index += 1
+    except BaseException:
+        queue.put(traceback.format_exc())
+
+
+class ParallelSimulation(Simulation):
+    """Консервативная параллельная модель для большого числа источников.
+
+    Поступления генерируют рабочие процессы, каждый для своей части источников,
+    и передают их окнами длины lookahead через очереди. Центральный процесс
+    сливает окна всех рабочих по времени и обрабатывает поступления окна прямо
+    из слитого массива, не помещая их в календарь: в календаре остаются только
+    окончания обслуживания и события масштабирования, поэтому он не растет с
+    числом источников. Так как потоки случайных чисел источников и серверов
+    зависят только от seed, результат совпадает с Simulation(seed=seed).
+
+    Диспетчеры, буфер и статистика по-прежнему выполняются в одном процессе,
+    поэтому прогон не быстрее Simulation; движок служит второй реализацией
+    для проверки эквивалентности (golden check --engine parallel). Модель
+    всегда работает до simulation_time.
+    """
+
+    def __init__(self, config: Dict, seed: Optional[Seed] = None, workers: int = 2, lookahead: Optional[float] = None,
+                 verbose: bool = False, queue_size: int = 8, poll_interval: float = 1.0):
+        self.workers = max(1, min(workers, len(config['sources'])))
+        self.lookahead = lookahead or config['simulation_time'] / 100
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        super().__init__(config, verbose=verbose, seed=seed)
+
+    def _schedule_initial_events(self):
+        # Поступления приходят от рабочих процессов, здесь планируются только конец и проверки масштабирования
+        heapq.heappush(self.event_queue, Event(event_type='END', time=self.config['simulation_time']))
+        self._schedule_scale_checks()
+
+    def run(self):
+        simulation_time = self.config['simulation_time']
+        partitions = [[] for _ in range(self.workers)]
+        for i, source in enumerate(self.sources):
+            partitions[i % self.workers].append((i, source.source_id, source.lambda_param))
+
+        context = multiprocessing.get_context()
+        queues = [context.Queue(maxsize=self.queue_size) for _ in partitions]
+        processes = [
+            context.Process(target=generate_arrivals,
+                            args=(partition, self.seed, simulation_time, self.lookahead, queue),
+                            daemon=True)
+            for partition, queue in zip(partitions, queues)
+        ]
+        for process in processes:
+            process.start()
+
+        self.running = True
+        try:
+            index = 0
+            while self.running:
+                end = window_end(index, self.lookahead, simulation_time)
+                batches = [self._receive(queue, process) for queue, process in zip(queues, processes)]
+                self._run_window(batches, end)
+
+                if end >= simulation_time:
+                    break
+                index += 1
+
+            while self.run_step():
+                pass
+        except BaseException:
+            # Рабочие могут ждать места в очереди - без остановки join не вернется
+            for process in processes:
+                process.terminate()
+            for queue in queues:
+                self._drain(queue)
+            raise
+        finally:
+            for process in processes:
+                process.join()
+            for queue in queues:
+                queue.close()
+
+    def _receive(self, queue, process) -> Tuple[array, array]:
+        while True:
+            try:
+                message = queue.get(timeout=self.poll_interval)
+                break
+            except queue_module.Empty:
+                if process.is_alive():
+                    continue
+                # Процесс завершился: окно либо уже в канале, либо не придет
+                try:
+                    message = queue.get(timeout=self.poll_interval)
+                    break
+                except queue_module.Empty:
+                    raise RuntimeError(
+                        f"Рабочий процесс {process.name} завершился без данных (код {process.exitcode})") from None
+
+        if isinstance(message, str):
+            raise RuntimeError(f"Ошибка в рабочем процессе {process.name}:\n{message}")
+        return message
+
+    @staticmethod
+    def _drain(queue):
+        try:
+            while True:
+                queue.get_nowait()
+        except (queue_module.Empty, OSError, ValueError):
+            pass
+
+    def _run_window(self, batches: List[Tuple[array, array]], end: float):
+        times = array('d')
+        indices = array('i')
+        for batch_times, batch_indices in batches:
+            times.extend(batch_times)
+            indices.extend(batch_indices)
+        # Окна рабочих уже упорядочены, сортировка только сливает их
+        order = sorted(range(len(times)), key=times.__getitem__)
+
+        calendar = self.event_queue
+        sources = self.sources
+        for position in order:
+            time = times[position]
+            # События календаря не позже поступления обрабатываются первыми
+            while calendar and calendar[0].time <= time:
+                if not self.run_step():
+                    return
+            if not self.running:
+                return
+
+            self.current_time = time
+            self._generate(sources[indices[position]])
+            if self.progress is not None:
+                self.progress.on_step(self)
+
+        # Все поступления раньше end уже обработаны - события календаря до end безопасны
+        while calendar and calendar[0].time < end and self.run_step():
+            pass
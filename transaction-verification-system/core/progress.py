@@ -0,0 +1,113 @@
+import json
+import math
+import sys
+import time
+from statistics import NormalDist
+from typing import Callable, Dict, Optional, TextIO
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_memory_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class ProgressReporter:
+    """Периодические снимки хода длинного прогона.
+
+    Снимок делается раз в interval секунд реального времени (clock='wall')
+    или модельного времени (clock='virtual'). Часы опрашиваются только раз в
+    check_every событий, поэтому цикл событий почти не замедляется.
+    Снимки пишутся текстом в stderr, строками JSON в output или передаются в callback.
+    """
+
+    def __init__(self, interval: float, clock: str = 'wall', output: Optional[TextIO] = None,
+                 json_lines: bool = False, callback: Optional[Callable[[Dict], None]] = None,
+                 confidence: float = 0.9, check_every: int = 256):
+        if clock not in ('wall', 'virtual'):
+            raise ValueError(f"Неизвестные часы: {clock}")
+        self.interval = interval
+        self.clock = clock
+        self.output = output if output is not None else sys.stderr
+        self.json_lines = json_lines
+        self.callback = callback
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.check_every = check_every
+
+        self.events = 0
+        self.started = time.perf_counter()
+        self.next_report = interval
+        self.last_wall = 0.0
+        self.last_events = 0
+
+    def on_step(self, sim):
+        self.events += 1
+        if self.clock == 'virtual':
+            if sim.current_time >= self.next_report:
+                self.report(sim)
+                self.next_report = (math.floor(sim.current_time / self.interval) + 1) * self.interval
+        elif self.events % self.check_every == 0:
+            if time.perf_counter() - self.started >= self.next_report:
+                self.report(sim)
+                self.next_report += self.interval
+
+    def snapshot(self, sim) -> Dict:
+        wall = time.perf_counter() - self.started
+        virtual = sim.current_time
+        simulation_time = sim.config['simulation_time']
+
+        window = wall - self.last_wall
+        recent_rate = (self.events - self.last_events) / window if window > 0 else 0.0
+        eta = None
+        if 0 < virtual < simulation_time and math.isfinite(simulation_time):
+            eta = wall * (simulation_time - virtual) / virtual
+
+        # Биномиальный интервал без учета автокорреляции отказов
+        statistics = sim.statistics
+        total = statistics.total_transactions
+        rejection_rate = statistics.get_rejection_rate()
+        half_width = self.z * math.sqrt(rejection_rate * (1 - rejection_rate) / total) if total else 0.0
+
+        return {
+            'wall_time': wall,
+            'virtual_time': virtual,
+            'progress': virtual / simulation_time if math.isfinite(simulation_time) and simulation_time else None,
+            'events': self.events,
+            'events_per_sec': self.events / wall if wall > 0 else 0.0,
+            'recent_events_per_sec': recent_rate,
+            'eta_seconds': eta,
+            'transactions': total,
+            'rejection_rate': rejection_rate,
+            'rejection_rate_ci_low': max(0.0, rejection_rate - half_width),
+            'rejection_rate_ci_high': min(1.0, rejection_rate + half_width),
+            'peak_memory_mb': peak_memory_mb()
+        }
+
+    def report(self, sim) -> Dict:
+        snapshot = self.snapshot(sim)
+        self.last_wall = snapshot['wall_time']
+        self.last_events = self.events
+
+        if self.callback:
+            self.callback(snapshot)
+        elif self.json_lines:
+            self.output.write(json.dumps(snapshot) + '\n')
+            self.output.flush()
+        else:
+            eta = f"{snapshot['eta_seconds']:.1f}s" if snapshot['eta_seconds'] is not None else '-'
+            memory = f"{snapshot['peak_memory_mb']:.1f}MB" if snapshot['peak_memory_mb'] is not None else '-'
+            self.output.write(
+                f"[ПРОГРЕСС] t={snapshot['virtual_time']:.2f} events={snapshot['events']} "
+                f"ev/s={snapshot['recent_events_per_sec']:.0f} ETA={eta} "
+                f"P(отк)={snapshot['rejection_rate']:.4f} "
+                f"[{snapshot['rejection_rate_ci_low']:.4f}; {snapshot['rejection_rate_ci_high']:.4f}] "
+                f"mem={memory}\n")
+            self.output.flush()
+        return snapshot
@@ -0,0 +1,217 @@
+import copy
+import math
+from statistics import NormalDist, stdev
+from typing import Dict, List, Optional, Sequence, Tuple
+from .simulation import Simulation
+from .statistics import Statistics
+from utils.distributions import Seed, SeedSequence
+
+
+class SplittingEstimator:
+    """Оценка вероятности переполнения буфера методом расщепления (fixed effort).
+
+    Цикл начинается, когда буфер становится непустым, и заканчивается, когда он
+    снова пустеет. Уровни - длины очереди; на каждом уровне запускается ровно
+    effort траекторий из состояний, достигших этого уровня. Доля циклов пробного
+    прогона, дошедших до первого уровня, умноженная на доли успешных траекторий, -
+    несмещенная оценка P(отказ за цикл).
+    """
+
+    def __init__(self, config: Dict, levels: Optional[Sequence[int]] = None, effort: int = 200,
+                 pilot_cycles: int = 2000, max_steps: int = 1_000_000, seed: Optional[Seed] = None):
+        if 'stages' in config:
+            raise ValueError("Оценка редких отказов поддерживает только одноэтапную модель")
+        self.config = dict(config)
+        self.config['simulation_time'] = math.inf
+        self.config['stats_window'] = 0
+        self.config['keep_history'] = False
+
+        capacity = config['buffer_capacity']
+        self.levels: List[int] = sorted(set(levels)) if levels else list(range(1, capacity + 1))
+        if not self.levels or self.levels[0] < 1 or self.levels[-1] > capacity:
+            raise ValueError(f"Уровни должны лежать в диапазоне [1, {capacity}]")
+
+        # Пробные прогоны и клоны получают независимые подпотоки корневого зерна
+        self.seed = seed if isinstance(seed, SeedSequence) else SeedSequence(seed)
+        self.rng = self.seed.stream('splitting')
+        self._spawned = 0
+
+        self.effort = effort
+        self.pilot_cycles = max(pilot_cycles, effort)
+        self.max_steps = max_steps
+
+    def run(self, confidence: float = 0.9, replications: int = 5) -> Dict:
+        """Независимые повторения оценки; доверительный интервал строится по их разбросу.
+
+        При replications=1 используется приближенная формула для fixed effort,
+        которая занижает погрешность из-за зависимости клонов одного состояния.
+        """
+        runs = [self._replicate() for _ in range(replications)]
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+        def interval(key, analytic_error_key):
+            values = [r[key] for r in runs]
+            mean = sum(values) / len(values)
+            if len(values) > 1 and mean > 0:
+                relative_error = stdev(values) / (mean * math.sqrt(len(values)))
+            else:
+                relative_error = runs[0][analytic_error_key]
+            return mean, relative_error, max(0.0, mean * (1 - z * relative_error)), mean * (1 + z * relative_error)
+
+        overflow, overflow_error, overflow_low, overflow_high = interval('overflow_probability', 'relative_error')
+        rate, rate_error, rate_low, rate_high = interval('rejection_rate', 'rejection_rate_relative_error')
+
+        return {
+            'seed': str(self.seed),
+            'levels': self.levels,
+            'effort': self.effort,
+            'replications': replications,
+            'entrance_probability': sum(r['entrance_probability'] for r in runs) / len(runs),
+            'level_probabilities': [sum(p) / len(p) for p in zip(*(r['level_probabilities'] for r in runs))],
+            'overflow_probability': overflow,
+            'relative_error': overflow_error,
+            'ci_low': overflow_low,
+            'ci_high': overflow_high,
+            'arrivals_per_cycle': sum(r['arrivals_per_cycle'] for r in runs) / len(runs),
+            'rejections_per_overflow': sum(r['rejections_per_overflow'] for r in runs) / len(runs),
+            'rejection_rate': rate,
+            'rejection_rate_relative_error': rate_error,
+            'rejection_rate_ci_low': rate_low,
+            'rejection_rate_ci_high': rate_high
+        }
+
+    def _replicate(self) -> Dict:
+        entrances, arrivals_per_cycle, entrance_probability, cycles = self._pilot()
+
+        level_probabilities = []
+        states = entrances
+        # Последний переход - от верхнего уровня к отказу
+        for target in self.levels[1:] + [None]:
+            states, probability = self._stage(states, target)
+            level_probabilities.append(probability)
+            if probability == 0:
+                break
+
+        overflow_probability = entrance_probability * math.prod(level_probabilities)
+        if overflow_probability > 0:
+            # Дисперсия произведения независимых биномиальных долей (приближение первого порядка)
+            relative_error = math.sqrt(
+                (1 - entrance_probability) / (cycles * entrance_probability)
+                + sum((1 - p) / (self.effort * p) for p in level_probabilities))
+            rejections_per_overflow, rejections_variance = self._rejections_per_overflow(states)
+            rate_relative_error = math.sqrt(
+                relative_error ** 2 + rejections_variance / (self.effort * rejections_per_overflow ** 2))
+        else:
+            relative_error = rate_relative_error = math.inf
+            rejections_per_overflow = 0.0
+
+        return {
+            'entrance_probability': entrance_probability,
+            'level_probabilities': level_probabilities,
+            'overflow_probability': overflow_probability,
+            'relative_error': relative_error,
+            'arrivals_per_cycle': arrivals_per_cycle,
+            'rejections_per_overflow': rejections_per_overflow,
+            'rejection_rate': overflow_probability * rejections_per_overflow / arrivals_per_cycle,
+            'rejection_rate_relative_error': rate_relative_error
+        }
+
+    def _spawn(self, kind: str) -> SeedSequence:
+        self._spawned += 1
+        return self.seed.spawn(kind, self._spawned)
+
+    def _new_simulation(self) -> Simulation:
+        sim = Simulation(self.config, verbose=False, seed=self._spawn('pilot'))
+        sim.running = True
+        return sim
+
+    def _clone(self, sim: Simulation) -> Simulation:
+        # Клонам нужна только динамика модели и приращения счетчика отказов,
+        # поэтому накопленная статистика не копируется
+        memo = {id(sim.statistics): Statistics(window=0, keep_history=False)}
+        clone = copy.deepcopy(sim, memo)
+        # Копии генераторов повторили бы одну траекторию - каждый клон продолжает своим подпотоком
+        clone.reseed(self._spawn('clone'))
+        return clone
+
+    def _pilot(self):
+        """Обычный прогон на pilot_cycles циклов; входы на первый уровень отбираются выборкой-резервуаром.
+
+        Очередь растет по одной заявке, поэтому первый уровень выше 1 достигается
+        не сразу после опустошения: флаг reached запоминает, что цикл уже дошел
+        до уровня, и сбрасывается только при пустом буфере.
+        """
+        sim = self._new_simulation()
+        entrances = []
+        cycles = 0
+        reached_cycles = 0
+        was_empty = True
+        reached = False
+
+        for _ in range(self.max_steps):
+            if not sim.run_step():
+                break
+            length = len(sim.buffer)
+            if length == 0:
+                if not was_empty and cycles >= self.pilot_cycles:
+                    break
+                was_empty = True
+                reached = False
+                continue
+
+            if was_empty:
+                cycles += 1
+                was_empty = False
+            if not reached and length >= self.levels[0]:
+                reached = True
+                reached_cycles += 1
+                if len(entrances) < self.effort:
+                    entrances.append(self._clone(sim))
+                else:
+                    slot = self.rng.randrange(reached_cycles)
+                    if slot < self.effort:
+                        entrances[slot] = self._clone(sim)
+
+        if not entrances:
+            raise RuntimeError("Пробный прогон ни разу не достиг первого уровня")
+
+        arrivals_per_cycle = sim.statistics.total_transactions / cycles
+        return entrances, arrivals_per_cycle, reached_cycles / cycles, cycles
+
+    def _stage(self, starts: List[Simulation], target: Optional[int]):
+        reached = []
+        for _ in range(self.effort):
+            sim = self._clone(self.rng.choice(starts))
+            if self._advance(sim, target):
+                reached.append(sim)
+        return reached, len(reached) / self.effort
+
+    def _advance(self, sim: Simulation, target: Optional[int]) -> bool:
+        """Продвигает траекторию до уровня target (None - до отказа) или опустошения буфера"""
+        rejected = sim.statistics.rejected_transactions
+        for _ in range(self.max_steps):
+            if not sim.run_step():
+                return False
+            if target is None:
+                if sim.statistics.rejected_transactions > rejected:
+                    return True
+            elif len(sim.buffer) >= target:
+                return True
+            if sim.buffer.is_empty():
+                return False
+        return False
+
+    def _rejections_per_overflow(self, overflowed: List[Simulation]) -> Tuple[float, float]:
+        """Среднее и дисперсия числа отказов в цикле при условии, что переполнение произошло"""
+        counts = []
+        for _ in range(self.effort):
+            sim = self._clone(self.rng.choice(overflowed))
+            rejected = sim.statistics.rejected_transactions - 1
+            for _ in range(self.max_steps):
+                if not sim.run_step() or sim.buffer.is_empty():
+                    break
+            counts.append(sim.statistics.rejected_transactions - rejected)
+
+        mean = sum(counts) / len(counts)
+        variance = sum((c - mean) ** 2 for c in counts) / (len(counts) - 1) if len(counts) > 1 else 0.0
+        return mean, variance
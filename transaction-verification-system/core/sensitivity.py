@@ -0,0 +1,222 @@
+import copy
+import math
+from statistics import NormalDist, stdev
+from typing import Dict, List, Optional, Tuple
+from .simulation import Simulation
+from utils.distributions import Seed, SeedSequence
+
+METRICS = ('rejection_rate', 'avg_wait_time', 'avg_system_time')
+IPA_METRICS = ('avg_wait_time', 'avg_system_time', 'avg_service_time')
+
+
+class IPAEstimator:
+    """Оценка производных среднего ожидания и пребывания по min_time/max_time серверов (IPA).
+
+    Время обслуживания S = min + (max - min) * U, поэтому dS/dmin = 1 - U и dS/dmax = U.
+    Производная момента ухода заявки - производная начала обслуживания плюс dS.
+    Заявка из буфера начинает обслуживание в момент ухода предыдущей заявки того же
+    сервера и наследует ее производную, заявка без ожидания - нулевую.
+    Оценка верна, пока малое изменение параметров не меняет порядок событий на
+    траектории; отказы при полном буфере этот порядок меняют, поэтому для
+    вероятности отказа IPA не применяется (ее производная по траектории равна нулю).
+    """
+
+    def __init__(self, sim: Simulation):
+        self.sim = sim
+        self.servers = {server.server_id: server for server in sim.servers}
+        self.parameters: List[Tuple[str, str]] = [
+            (server_id, bound) for server_id in self.servers for bound in ('min_time', 'max_time')]
+        self.index = {parameter: i for i, parameter in enumerate(self.parameters)}
+
+        size = len(self.parameters)
+        self.last_departure: Dict[str, List[float]] = {server_id: [0.0] * size for server_id in self.servers}
+        self.start_derivatives: Dict[str, List[float]] = {}
+        self.completed = 0
+        self.wait_sum = [0.0] * size
+        self.system_sum = [0.0] * size
+        self.service_sum = [0.0] * size
+
+        sim.statistics.add_listener(self.on_event)
+
+    def on_event(self, event: Dict):
+        if event['type'] == 'SERVICE_START':
+            server_id = event['server_id']
+            if event.get('wait_time', 0.0) > 0 and server_id in self.last_departure:
+                derivative = list(self.last_departure[server_id])
+            else:
+                derivative = [0.0] * len(self.parameters)
+            self.start_derivatives[event['transaction_id']] = derivative
+
+        elif event['type'] == 'SERVICE_END':
+            server_id = event['server_id']
+            start = self.start_derivatives.pop(event['transaction_id'], None)
+            server = self.servers.get(server_id)
+            if start is None or server is None:
+                return
+
+            spread = server.max_process_time - server.min_process_time
+            u = (event['service_time'] - server.min_process_time) / spread if spread > 0 else 0.0
+            service = [0.0] * len(self.parameters)
+            service[self.index[server_id, 'min_time']] = 1.0 - u
+            service[self.index[server_id, 'max_time']] = u
+
+            departure = [s + d for s, d in zip(start, service)]
+            self.last_departure[server_id] = departure
+
+            self.completed += 1
+            for i in range(len(self.parameters)):
+                self.wait_sum[i] += start[i]
+                self.system_sum[i] += departure[i]
+                self.service_sum[i] += service[i]
+
+    def detach(self):
+        self.sim.statistics.remove_listener(self.on_event)
+
+    def get_derivatives(self) -> Dict[str, Dict[str, float]]:
+        n = self.completed or 1
+        return {
+            f"servers.{server_id}.{bound}": {
+                'avg_wait_time': self.wait_sum[i] / n,
+                'avg_system_time': self.system_sum[i] / n,
+                'avg_service_time': self.service_sum[i] / n
+            }
+            for i, (server_id, bound) in enumerate(self.parameters)
+        }
+
+
+def run_metrics(config: Dict, seed: Seed, ipa: bool = False) -> Tuple[Dict, Optional[Dict]]:
+    sim = Simulation(config, verbose=False, seed=seed)
+    estimator = IPAEstimator(sim) if ipa else None
+    sim.running = True
+    while sim.run_step():
+        pass
+    if estimator:
+        estimator.detach()
+
+    statistics = sim.statistics
+    completed = sum(stats['completed'] for stats in statistics.source_stats.values())
+    total_wait = sum(stats['total_wait_time'] for stats in statistics.source_stats.values())
+    total_system = sum(stats['total_system_time'] for stats in statistics.source_stats.values())
+    metrics = {
+        'rejection_rate': statistics.get_rejection_rate(),
+        'avg_wait_time': total_wait / completed if completed else 0.0,
+        'avg_system_time': total_system / completed if completed else 0.0
+    }
+    return metrics, estimator.get_derivatives() if estimator else None
+
+
+class SensitivityAnalysis:
+    """Производные вероятности отказа и среднего ожидания по параметрам модели.
+
+    Для lambda источников и min_time/max_time серверов - центральные разности
+    с шагом relative_step от значения, но не меньше absolute_step (иначе у
+    нулевого параметра шаг нулевой). Если шаг вниз делает параметр
+    отрицательным, разность берется вперед. Для buffer_capacity - разность на
+    одно место. Все прогоны одной реплики используют один seed: потоки случайных
+    чисел привязаны к источникам и серверам, поэтому изменение параметра меняет
+    только масштаб тех же случайных величин (общие случайные числа). Для
+    параметров серверов дополнительно считается IPA по базовому прогону.
+    Погрешность - по разбросу между независимыми репликами.
+    """
+
+    def __init__(self, config: Dict, seed: int = 0, replications: int = 10, relative_step: float = 0.05,
+                 absolute_step: float = 0.01):
+        if 'stages' in config:
+            raise ValueError("Анализ чувствительности поддерживает только одноэтапную модель")
+        self.config = copy.deepcopy(config)
+        self.config['keep_history'] = False
+        self.seed = seed
+        self.replications = replications
+        self.relative_step = relative_step
+        self.absolute_step = absolute_step
+
+    def parameters(self) -> List[Tuple[str, List, str, float]]:
+        """(имя, путь к параметру в конфигурации, вид разности, шаг)"""
+        result = []
+        for i, source in enumerate(self.config['sources']):
+            step = self._step(source['lambda'])
+            result.append((f"sources.{source['id']}.lambda", ['sources', i, 'lambda'],
+                           self._kind(source['lambda'], step), step))
+        for i, server in enumerate(self.config['servers']):
+            # Шаг ограничен так, чтобы min_time + h не превышал max_time - h
+            spread = (server['max_time'] - server['min_time']) / 2
+            for bound in ('min_time', 'max_time'):
+                step = self._step(server[bound])
+                if spread > 0:
+                    step = min(step, spread)
+                result.append((f"servers.{server['id']}.{bound}", ['servers', i, bound],
+                               self._kind(server[bound], step), step))
+        result.append(('buffer_capacity', ['buffer_capacity'], 'discrete', 1))
+        return result
+
+    def _step(self, value: float) -> float:
+        return max(self.relative_step * abs(value), self.absolute_step)
+
+    @staticmethod
+    def _kind(value: float, step: float) -> str:
+        # Интенсивность и времена обслуживания не бывают отрицательными
+        return 'central' if value - step >= 0 else 'forward'
+
+    def _perturbed(self, path: List, delta: float) -> Dict:
+        config = copy.deepcopy(self.config)
+        target = config
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] += delta
+        return config
+
+    def run(self, confidence: float = 0.9) -> Dict:
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        parameters = self.parameters()
+
+        base_runs = []
+        ipa_runs = []
+        differences = {name: {metric: [] for metric in METRICS} for name, *_ in parameters}
+
+        root = SeedSequence(self.seed)
+        for replica in range(self.replications):
+            seed = root.spawn('replica', replica)
+            base, ipa = run_metrics(self.config, seed, ipa=True)
+            base_runs.append(base)
+            ipa_runs.append(ipa)
+
+            for name, path, kind, step in parameters:
+                if kind == 'central':
+                    upper, _ = run_metrics(self._perturbed(path, step), seed)
+                    lower, _ = run_metrics(self._perturbed(path, -step), seed)
+                    for metric in METRICS:
+                        differences[name][metric].append((upper[metric] - lower[metric]) / (2 * step))
+                elif kind == 'forward':
+                    upper, _ = run_metrics(self._perturbed(path, step), seed)
+                    for metric in METRICS:
+                        differences[name][metric].append((upper[metric] - base[metric]) / step)
+                else:
+                    # Емкость буфера целая: прирост метрики от одного дополнительного места
+                    upper, _ = run_metrics(self._perturbed(path, step), seed)
+                    for metric in METRICS:
+                        differences[name][metric].append(upper[metric] - base[metric])
+
+        def summarize(values):
+            mean = sum(values) / len(values)
+            std = stdev(values) if len(values) > 1 else 0.0
+            return {'estimate': mean, 'half_width': z * std / math.sqrt(len(values))}
+
+        steps = {name: (kind, step) for name, _, kind, step in parameters}
+        return {
+            'replications': self.replications,
+            'seed': self.seed,
+            'relative_step': self.relative_step,
+            'absolute_step': self.absolute_step,
+            'base': {metric: summarize([run[metric] for run in base_runs]) for metric in METRICS},
+            'finite_differences': {
+                name: {'difference': steps[name][0], 'step': steps[name][1],
+                       **{metric: summarize(values) for metric, values in metrics.items()}}
+                for name, metrics in differences.items()
+            },
+            # Без отказов порядок событий устойчив к малым изменениям и IPA несмещена
+            'ipa_applicable': all(run['rejection_rate'] == 0 for run in base_runs),
+            'ipa': {
+                name: {metric: summarize([run[name][metric] for run in ipa_runs]) for metric in IPA_METRICS}
+                for name in ipa_runs[0]
+            }
+        }
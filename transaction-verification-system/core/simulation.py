@@ -1,71 +1,168 @@
 import heapq
 import random
+from dataclasses import replace
 from typing import Dict, List, Optional, Tuple
 from .entities import PaymentSource, Server, Transaction
-from .buffer import Buffer
-from .dispatchers import DispatcherIn, DispatcherOut
+from .autoscaling import Autoscaler, create_scaling_policy
+from .buffer import Buffer, create_policy
+from .network import Stage
 from .statistics import Statistics
-from utils.distributions import exponential
+from utils.distributions import Seed, SeedSequence, routing_stream, server_stream, source_stream
 
 
 class Event:
     def __init__(self, event_type: str, time: float, source_id: Optional[str] = None,
                  transaction_id: Optional[str] = None, server_id: Optional[str] = None,
-                 transaction: Optional[Transaction] = None):
+                 transaction: Optional[Transaction] = None, stage: int = 0):
         self.event_type = event_type
         self.time = time
         self.source_id = source_id
         self.transaction_id = transaction_id
         self.server_id = server_id
         self.transaction = transaction
+        self.stage = stage
 
     def __lt__(self, other):
         return self.time < other.time
 
 
 class Simulation:
-    def __init__(self, config: Dict, verbose: bool = True):
+    def __init__(self, config: Dict, verbose: bool = True, seed: Optional[Seed] = None):
         self.config = config
+        # Без явного зерна берется случайное, но прогон все равно воспроизводим по self.seed
+        self.seed = SeedSequence() if seed is None else seed
         self.current_time = 0.0
         self.event_queue = []
         self.running = False
         self.verbose = verbose
+        self.progress = None
 
-        self.statistics = Statistics()
-        self.buffer = Buffer(config['buffer_capacity'])
+        window = config.get('stats_window', config['simulation_time'] / 100)
+        keep_history = config.get('keep_history', True)
+        self.statistics = Statistics(window=window, keep_history=keep_history)
 
         self.sources = []
         for source_config in config['sources']:
             source = PaymentSource(
                 source_id=source_config['id'],
                 priority=source_config['priority'],
-                lambda_param=source_config['lambda']
+                lambda_param=source_config['lambda'],
+                rng=source_stream(self.seed, source_config['id'])
             )
             self.sources.append(source)
+        self.sources_by_id = {source.source_id: source for source in self.sources}
+
+        # Без ключа stages модель - один этап, статистика которого и есть общая
+        self.multi_stage = 'stages' in config
+        if self.multi_stage:
+            self.stages = [self._build_stage(stage_config, Statistics(window=window, keep_history=keep_history),
+                                             stream_prefix=f"{stage_config['id']}/")
+                           for stage_config in config['stages']]
+            self._resolve_routing(config['stages'])
+            stage_ids = [stage.stage_id for stage in self.stages]
+            self.entry_stage = stage_ids.index(config.get('entry_stage', stage_ids[0]))
+            for stage in self.stages:
+                stage.statistics.add_listener(self._on_stage_event)
+        else:
+            self.stages = [self._build_stage(config, self.statistics)]
+            self.entry_stage = 0
+
+        # Транзакции внутри сети: исходная заявка и накопленное время обслуживания
+        self.in_network: Dict[str, Tuple[Transaction, float]] = {}
+
+        entry = self.stages[self.entry_stage]
+        self.buffer = entry.buffer
+        self.servers = entry.servers
+        self.servers_by_id = entry.servers_by_id
+        self.dispatcher_in = entry.dispatcher_in
+        self.dispatcher_out = entry.dispatcher_out
 
-        self.servers = []
-        for server_config in config['servers']:
-            server = Server(
+        self._schedule_initial_events()
+
+    def _build_stage(self, stage_config: Dict, statistics: Statistics, stream_prefix: str = '') -> Stage:
+        servers = [
+            Server(
                 server_id=server_config['id'],
                 min_time=server_config['min_time'],
-                max_time=server_config['max_time']
+                max_time=server_config['max_time'],
+                rng=server_stream(self.seed, stream_prefix + server_config['id'])
             )
-            self.servers.append(server)
+            for server_config in stage_config['servers']
+        ]
+        stage_id = stage_config.get('id', 'main')
+        stage = Stage(
+            stage_id=stage_id,
+            buffer=Buffer(stage_config['buffer_capacity'], create_policy(stage_config.get('buffer_policy'))),
+            servers=servers,
+            statistics=statistics,
+            dispatcher=stage_config.get('dispatcher', 'priority_packets'),
+            verbose=self.verbose,
+            rng=routing_stream(self.seed, stage_id),
+            stream_prefix=stream_prefix
+        )
 
-        self.dispatcher_in = DispatcherIn(self.buffer, self.servers, self.statistics, verbose)
-        self.dispatcher_out = DispatcherOut(self.buffer, self.servers, self.statistics, verbose)
+        scaling = stage_config.get('autoscaling')
+        if scaling:
+            if 'server' in scaling:
+                template = scaling['server']
+            elif stage_config['servers']:
+                template = stage_config['servers'][-1]
+            else:
+                raise ValueError(f"Этап {stage_id} начинает без серверов - нужен шаблон autoscaling.server")
+            stage.autoscaler = Autoscaler(
+                stage,
+                create_scaling_policy(scaling['policy']),
+                server_config=template,
+                seed=self.seed,
+                stream_prefix=stream_prefix,
+                min_servers=scaling.get('min_servers', 1),
+                max_servers=scaling.get('max_servers'),
+                startup_delay=scaling.get('startup_delay', 0.0),
+                cooldown=scaling.get('cooldown'),
+                interval=scaling.get('interval', 1.0),
+                scale_down_delay=scaling.get('scale_down_delay')
+            )
+        return stage
 
-        self._schedule_initial_events()
+    def reseed(self, seed: Seed):
+        """Переводит все сущности на потоки другого зерна; уже запланированные события не меняются"""
+        self.seed = seed
+        for source in self.sources:
+            source.rng = source_stream(seed, source.source_id)
+        for stage in self.stages:
+            stage.rng = routing_stream(seed, stage.stage_id)
+            for server in stage.servers:
+                server.rng = server_stream(seed, stage.stream_prefix + server.server_id)
+            if stage.autoscaler:
+                stage.autoscaler.seed = seed
+                for server in stage.autoscaler.starting + stage.autoscaler.stopped:
+                    server.rng = server_stream(seed, stage.stream_prefix + server.server_id)
+
+    def _resolve_routing(self, stage_configs: List[Dict]):
+        index = {stage.stage_id: i for i, stage in enumerate(self.stages)}
+        for stage, stage_config in zip(self.stages, stage_configs):
+            routes = stage_config.get('routing', [])
+            if sum(route['probability'] for route in routes) > 1.0 + 1e-9:
+                raise ValueError(f"Сумма вероятностей маршрутов этапа {stage.stage_id} больше 1")
+            for route in routes:
+                if route['to'] not in index:
+                    raise ValueError(f"Маршрут этапа {stage.stage_id} ведет в неизвестный этап {route['to']}")
+            stage.routing = [(index[route['to']], route['probability']) for route in routes]
+
+    def _on_stage_event(self, event: Dict):
+        # Отказ или вытеснение на любом этапе - потеря заявки для сети в целом
+        if event['type'] not in ('REJECTED', 'DISPLACED'):
+            return
+        origin, _ = self.in_network.pop(event['transaction_id'], (None, 0.0))
+        if origin is not None:
+            self.statistics.record_rejection(origin.source_id)
+            self.statistics.record_transaction_rejected(origin, event['time'])
 
     def _schedule_initial_events(self):
         for source in self.sources:
-            delay = exponential(source.lambda_param)
-            event = Event(
-                event_type='GENERATE',
-                time=self.current_time + delay,
-                source_id=source.source_id
-            )
-            heapq.heappush(self.event_queue, event)
+            self._schedule_next_arrival(source)
+
+        self._schedule_scale_checks()
 
         end_event = Event(
             event_type='END',
@@ -85,59 +182,92 @@ class Simulation:
             self._handle_generate(event)
         elif event.event_type == 'PROCESS':
             self._handle_process(event)
+        elif event.event_type == 'SCALE_CHECK':
+            self._handle_scale_check(event)
+        elif event.event_type == 'SERVER_READY':
+            self._handle_server_ready(event)
         elif event.event_type == 'END':
             self.running = False
             return False
 
+        if self.progress is not None:
+            self.progress.on_step(self)
         return True
 
     def _handle_generate(self, event: Event):
-        source = next(s for s in self.sources if s.source_id == event.source_id)
+        source = self.sources_by_id[event.source_id]
+        self._generate(source)
+        self._schedule_next_arrival(source)
+
+    def _generate(self, source: PaymentSource):
         transaction = source.generate_transaction(self.current_time)
 
         if self.verbose:
             print(f"[ГЕНЕРАЦИЯ] Транзакция {transaction.id} от источника {source.source_id}")
 
-        status, end_time, server_id = self.dispatcher_in.process_transaction(transaction)
+        if self.multi_stage:
+            self.statistics.record_transaction_generated(transaction.source_id)
+            self.in_network[transaction.id] = (transaction, 0.0)
+
+        self._enter_stage(self.entry_stage, transaction)
+
+    def _schedule_next_arrival(self, source: PaymentSource):
+        next_event = Event(
+            event_type='GENERATE',
+            time=self.current_time + source.next_interarrival(),
+            source_id=source.source_id
+        )
+        heapq.heappush(self.event_queue, next_event)
+
+    def _enter_stage(self, stage_index: int, transaction: Transaction):
+        stage = self.stages[stage_index]
+        status, end_time, server_id = stage.dispatcher_in.process_transaction(transaction)
 
         if end_time and server_id:
             process_event = Event(
                 event_type='PROCESS',
                 time=end_time,
-                source_id=source.source_id,
+                source_id=transaction.source_id,
                 transaction_id=transaction.id,
                 server_id=server_id,
-                transaction=transaction
+                transaction=transaction,
+                stage=stage_index
             )
             heapq.heappush(self.event_queue, process_event)
 
-        next_delay = exponential(source.lambda_param)
-        next_event = Event(
-            event_type='GENERATE',
-            time=self.current_time + next_delay,
-            source_id=source.source_id
-        )
-        heapq.heappush(self.event_queue, next_event)
-
     def _handle_process(self, event: Event):
-        server = next(s for s in self.servers if s.server_id == event.server_id)
+        stage = self.stages[event.stage]
+        server = stage.servers_by_id[event.server_id]
+        finished = server.current_transaction
 
-        if server.current_transaction:
+        if finished:
             if self.verbose:
                 print(
-                    f"[ЗАВЕРШЕНИЕ] Транзакция {server.current_transaction.id} завершена на сервере {server.server_id}")
+                    f"[ЗАВЕРШЕНИЕ] Транзакция {finished.id} завершена на сервере {server.server_id}")
 
-            self.statistics.record_service_end(
-                server.current_transaction,
+            stage.statistics.record_service_end(
+                finished,
                 self.current_time
             )
 
+        service_time = self.current_time - server.current_start_time
         server.complete_processing()
 
-        results = self.dispatcher_out.on_server_free(server, self.current_time)
+        if stage.autoscaler and stage.autoscaler.is_draining(server):
+            # Снимаемый сервер доработал заявку и больше не берет новых
+            stage.autoscaler.retire(server, self.current_time)
+        else:
+            self._dispatch_free_server(event.stage, server)
+
+        if finished and self.multi_stage:
+            self._route(stage, finished, service_time)
+
+    def _dispatch_free_server(self, stage_index: int, server: Server):
+        stage = self.stages[stage_index]
+        results = stage.dispatcher_out.on_server_free(server, self.current_time)
 
         for end_time, server_id in results:
-            processing_server = next(s for s in self.servers if s.server_id == server_id)
+            processing_server = stage.servers_by_id[server_id]
             if processing_server.current_transaction:
                 process_event = Event(
                     event_type='PROCESS',
@@ -145,17 +275,79 @@ class Simulation:
                     source_id=processing_server.current_transaction.source_id,
                     transaction_id=processing_server.current_transaction.id,
                     server_id=server_id,
-                    transaction=processing_server.current_transaction
+                    transaction=processing_server.current_transaction,
+                    stage=stage_index
                 )
                 heapq.heappush(self.event_queue, process_event)
 
-    def run_automated(self, target_accuracy: float = 0.1, confidence: float = 0.9):
+    def _schedule_scale_checks(self):
+        for index, stage in enumerate(self.stages):
+            if stage.autoscaler:
+                self._schedule_scale_check(index, stage.autoscaler.interval)
+
+    def _schedule_scale_check(self, stage_index: int, time: float):
+        heapq.heappush(self.event_queue, Event(event_type='SCALE_CHECK', time=time, stage=stage_index))
+
+    def _handle_scale_check(self, event: Event):
+        autoscaler = self.stages[event.stage].autoscaler
+        for ready_time, server in autoscaler.check(self.current_time):
+            if self.verbose:
+                print(f"[МАСШТАБ] Запуск сервера {server.server_id}, готов к {ready_time:.2f}")
+            heapq.heappush(self.event_queue, Event(event_type='SERVER_READY', time=ready_time,
+                                                   server_id=server.server_id, stage=event.stage))
+        self._schedule_scale_check(event.stage, self.current_time + autoscaler.interval)
+
+    def _handle_server_ready(self, event: Event):
+        server = self.stages[event.stage].autoscaler.activate(event.server_id, self.current_time)
+        if server is None:
+            return
+        if self.verbose:
+            print(f"[МАСШТАБ] Сервер {server.server_id} принимает заявки")
+        # Новый сервер сразу забирает заявки, накопившиеся в буфере
+        self._dispatch_free_server(event.stage, server)
+
+    def get_capacity_statistics(self) -> Dict:
+        """Серверо-время по этапам; у этапов без масштабирования число серверов постоянно"""
+        hour = self.config.get('time_units_per_hour', 3600.0)
+        stages = {}
+        for stage in self.stages:
+            if stage.autoscaler:
+                summary = stage.autoscaler.get_summary(self.current_time)
+            else:
+                servers = len(stage.servers)
+                summary = {'server_time': servers * self.current_time, 'avg_servers': float(servers),
+                           'peak_servers': servers, 'scale_ups': 0, 'scale_downs': 0}
+            summary['server_hours'] = summary['server_time'] / hour
+            stages[stage.stage_id] = summary
+
+        server_time = sum(summary['server_time'] for summary in stages.values())
+        return {'server_time': server_time, 'server_hours': server_time / hour, 'stages': stages}
+
+    def _route(self, stage: Stage, transaction: Transaction, service_time: float):
+        origin, total_service = self.in_network[transaction.id]
+        total_service += service_time
+
+        target = stage.route()
+        if target is None:
+            del self.in_network[transaction.id]
+            self.statistics.record_exit(origin, self.current_time, total_service)
+            return
+
+        if self.verbose:
+            print(f"[МАРШРУТ] Транзакция {transaction.id}: {stage.stage_id} → {self.stages[target].stage_id}")
+
+        self.in_network[transaction.id] = (origin, total_service)
+        # На каждом этапе заявка видна с моментом поступления на этот этап
+        self._enter_stage(target, replace(origin, timestamp=self.current_time))
+
+    def run_automated(self, target_accuracy: float = 0.1, confidence: float = 0.9, log: bool = True):
         t_alpha = 1.643
 
         initial_iterations = 100
         self.running = True
 
-        print(f"[АВТО] Начальный прогон: {initial_iterations} транзакций")
+        if log:
+            print(f"[АВТО] Начальный прогон: {initial_iterations} транзакций")
 
         completed = 0
         while completed < initial_iterations and self.running:
@@ -170,7 +362,8 @@ class Simulation:
         required_iterations = int((t_alpha ** 2 * (1 - current_p)) / (current_p * target_accuracy ** 2))
         required_iterations = max(100, required_iterations)
 
-        print(f"[АВТО] На основе P(отк)={current_p:.3f} требуется {required_iterations} транзакций")
+        if log:
+            print(f"[АВТО] На основе P(отк)={current_p:.3f} требуется {required_iterations} транзакций")
 
         iteration = 1
         max_iterations = 10
@@ -179,7 +372,8 @@ class Simulation:
         while iteration <= max_iterations:
             additional = min(500, max(100, required_iterations - completed))
 
-            print(f"[АВТО] Итерация {iteration}: {additional} дополнительных транзакций")
+            if log:
+                print(f"[АВТО] Итерация {iteration}: {additional} дополнительных транзакций")
 
             for _ in range(additional):
                 if not self.run_step():
@@ -193,37 +387,63 @@ class Simulation:
                 relative_error = abs(current_p - previous_p) / previous_p if previous_p > 0 else 1.0
 
                 if relative_error < target_accuracy:
-                    print(
-                        f"[АВТО] Достигнута требуемая точность: {relative_error * 100:.1f}% < {target_accuracy * 100:.1f}%")
+                    if log:
+                        print(
+                            f"[АВТО] Достигнута требуемая точность: {relative_error * 100:.1f}% < {target_accuracy * 100:.1f}%")
                     break
-                else:
+                elif log:
                     print(f"[АВТО] Текущая ошибка: {relative_error * 100:.1f}%, требуется больше транзакций")
 
             iteration += 1
 
-        print(f"[АВТО] Финальная симуляция: {completed} транзакций, P(отк)={current_p:.3f}")
+        if log:
+            print(f"[АВТО] Финальная симуляция: {completed} транзакций, P(отк)={current_p:.3f}")
 
         while self.event_queue and self.running:
             self.run_step()
 
+    @staticmethod
+    def _servers_state(servers: List[Server]) -> List[Dict]:
+        return [
+            {
+                'id': s.server_id,
+                'busy': s.is_busy,
+                'current_transaction': s.current_transaction.id if s.current_transaction else None
+            }
+            for s in servers
+        ]
+
     def get_state(self) -> Dict:
+        """Состояние модели; верхние buffer/servers - входной этап, stages - все этапы"""
         return {
             'time': self.current_time,
             'buffer': list(self.buffer.queue),
-            'servers': [
-                {
-                    'id': s.server_id,
-                    'busy': s.is_busy,
-                    'current_transaction': s.current_transaction.id if s.current_transaction else None
-                }
-                for s in self.servers
-            ],
+            'buffer_capacity': self.buffer.capacity,
+            'servers': self._servers_state(self.servers),
             'current_packet': self.dispatcher_out.current_packet,
             'current_packet_source': self.dispatcher_out.current_packet_source,
             'active_packet_processing': self.dispatcher_out.active_packet_processing,
-            'statistics': self.statistics.get_summary()
+            'statistics': self.statistics.get_summary(),
+            'stages': [
+                {
+                    'id': stage.stage_id,
+                    'buffer': list(stage.buffer.queue),
+                    'buffer_capacity': stage.buffer.capacity,
+                    'buffer_length': len(stage.buffer),
+                    'servers': self._servers_state(stage.servers),
+                    'busy_servers': sum(1 for server in stage.servers if server.is_busy)
+                }
+                for stage in self.stages
+            ]
         }
 
+    def get_stage_statistics(self) -> Dict:
+        """Сводка по этапам и узкое место - этап с наибольшей загрузкой сервера, затем с наибольшей долей отказов"""
+        summaries = {stage.stage_id: stage.get_summary(self.current_time) for stage in self.stages}
+        bottleneck = max(summaries, key=lambda stage_id: (summaries[stage_id]['max_utilization'],
+                                                          summaries[stage_id]['rejection_rate']))
+        return {'stages': summaries, 'bottleneck': bottleneck}
+
     def get_event_calendar(self, limit: int = 20) -> List[Dict]:
         return self.statistics.get_event_history(limit)
 
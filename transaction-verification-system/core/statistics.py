@@ -1,37 +1,77 @@
-import math
+import json
 from collections import defaultdict
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 from .entities import Transaction
+from utils.moments import Moments
+from utils.quantiles import QuantileSketch
+from utils.time_weighted import TimeWeightedValue
+
+STATISTICS_VERSION = 1
+
+SOURCE_COUNTERS = ('generated', 'rejected', 'displaced', 'completed',
+                   'total_system_time', 'total_service_time', 'total_wait_time')
+SOURCE_ACCUMULATORS = ('wait_moments', 'service_moments', 'system_moments',
+                       'wait_sketch', 'service_sketch', 'system_sketch')
+SERVER_COUNTERS = ('busy_time', 'processed')
+SERVER_ACCUMULATORS = ('wait_sketch', 'system_sketch', 'busy_state')
 
 
 class Statistics:
-    def __init__(self):
+    """Накопленная статистика прогона.
+
+    Хранит только счетчики, моменты, скетчи квантилей и средние по времени,
+    поэтому статистики отдельных прогонов объединяются через merge и
+    сериализуются в компактный JSON (to_dict/from_dict). История событий,
+    подписчики и незавершенные обслуживания в объединение и JSON не входят.
+    """
+
+    def __init__(self, window: float = 10.0, keep_history: bool = True):
+        self.window = window
+        self.keep_history = keep_history
         self.rejected_transactions = 0
         self.total_transactions = 0
         self.simulation_start_time = 0.0
         self.simulation_end_time = 0.0
+        self.merged_time = 0.0
+
+        self.source_stats: Dict[str, Dict] = defaultdict(self._new_source_stats)
+        self.server_stats: Dict[str, Dict] = defaultdict(self._new_server_stats)
+
+        self.buffer_occupancy = TimeWeightedValue(window=self.window)
+        self.in_service = TimeWeightedValue(window=self.window)
 
-        self.source_stats: Dict[str, Dict] = defaultdict(lambda: {
+        self.service_starts: Dict[str, Dict] = {}
+        self.buffer_entries: Dict[str, float] = {}
+        self.event_history: List[Dict] = []
+        self.listeners: List[Callable[[Dict], None]] = []
+
+    @staticmethod
+    def _new_source_stats() -> Dict:
+        return {
             'generated': 0,
             'rejected': 0,
+            'displaced': 0,
             'completed': 0,
             'total_system_time': 0.0,
             'total_service_time': 0.0,
             'total_wait_time': 0.0,
-            'service_times': [],
-            'wait_times': [],
-            'system_times': []
-        })
+            'wait_moments': Moments(),
+            'service_moments': Moments(),
+            'system_moments': Moments(),
+            'wait_sketch': QuantileSketch(),
+            'service_sketch': QuantileSketch(),
+            'system_sketch': QuantileSketch()
+        }
 
-        self.server_stats: Dict[str, Dict] = defaultdict(lambda: {
+    def _new_server_stats(self) -> Dict:
+        return {
             'busy_time': 0.0,
             'processed': 0,
-            'last_start_time': 0.0
-        })
-
-        self.service_starts: Dict[str, Dict] = {}
-        self.buffer_entries: Dict[str, float] = {}
-        self.event_history: List[Dict] = []
+            'last_start_time': 0.0,
+            'wait_sketch': QuantileSketch(),
+            'system_sketch': QuantileSketch(),
+            'busy_state': TimeWeightedValue(window=self.window)
+        }
 
     def record_transaction_generated(self, source_id: str):
         self.total_transactions += 1
@@ -41,6 +81,18 @@ class Statistics:
         self.rejected_transactions += 1
         self.source_stats[source_id]['rejected'] += 1
 
+    def record_displacement(self, displaced: Transaction, arrival: Transaction, time: float):
+        """Вытесненная из буфера заявка теряется и учитывается как отказ своего источника"""
+        self.rejected_transactions += 1
+        self.source_stats[displaced.source_id]['rejected'] += 1
+        self.source_stats[displaced.source_id]['displaced'] += 1
+        self.buffer_entries.pop(displaced.id, None)
+        self._add_event('DISPLACED', time,
+                        transaction_id=displaced.id,
+                        source_id=displaced.source_id,
+                        displaced_by=arrival.id,
+                        displaced_by_source=arrival.source_id)
+
     def record_buffer_entry(self, transaction: Transaction, entry_time: float):
         self.buffer_entries[transaction.id] = entry_time
         self._add_event('BUFFER_ENTRY', entry_time,
@@ -55,12 +107,18 @@ class Statistics:
         }
 
         self.server_stats[server_id]['last_start_time'] = start_time
+        self.server_stats[server_id]['busy_state'].update(start_time, 1)
+        self.in_service.add(start_time, 1)
 
+        # Заявка, сразу попавшая на свободный сервер, ждала 0 - это тоже наблюдение
         wait_time = 0.0
-        if transaction.id in self.buffer_entries:
-            wait_time = start_time - self.buffer_entries[transaction.id]
-            self.source_stats[transaction.source_id]['wait_times'].append(wait_time)
+        entry_time = self.buffer_entries.pop(transaction.id, None)
+        if entry_time is not None:
+            wait_time = start_time - entry_time
             self.source_stats[transaction.source_id]['total_wait_time'] += wait_time
+        self.source_stats[transaction.source_id]['wait_moments'].add(wait_time)
+        self.source_stats[transaction.source_id]['wait_sketch'].add(wait_time)
+        self.server_stats[server_id]['wait_sketch'].add(wait_time)
 
         self._add_event('SERVICE_START', start_time,
                         transaction_id=transaction.id,
@@ -77,14 +135,19 @@ class Statistics:
 
             self.server_stats[server_id]['busy_time'] += service_time
             self.server_stats[server_id]['processed'] += 1
+            self.server_stats[server_id]['busy_state'].update(end_time, 0)
+            self.in_service.add(end_time, -1)
 
             self.source_stats[source_id]['completed'] += 1
-            self.source_stats[source_id]['service_times'].append(service_time)
+            self.source_stats[source_id]['service_moments'].add(service_time)
             self.source_stats[source_id]['total_service_time'] += service_time
+            self.source_stats[source_id]['service_sketch'].add(service_time)
 
             system_time = end_time - transaction.timestamp
-            self.source_stats[source_id]['system_times'].append(system_time)
+            self.source_stats[source_id]['system_moments'].add(system_time)
             self.source_stats[source_id]['total_system_time'] += system_time
+            self.source_stats[source_id]['system_sketch'].add(system_time)
+            self.server_stats[server_id]['system_sketch'].add(system_time)
 
             self._add_event('SERVICE_END', end_time,
                             transaction_id=transaction.id,
@@ -95,6 +158,37 @@ class Statistics:
 
             del self.service_starts[transaction.id]
 
+    def record_buffer_level(self, length: int, time: float):
+        self.buffer_occupancy.update(time, length)
+        if self.listeners:
+            self._notify({'type': 'BUFFER_LEVEL', 'time': time, 'length': length})
+
+    def record_exit(self, transaction: Transaction, exit_time: float, service_time: float):
+        """Выход заявки из сети этапов: сквозное время пребывания, ожидание - все, кроме обслуживания"""
+        stats = self.source_stats[transaction.source_id]
+        system_time = exit_time - transaction.timestamp
+        wait_time = system_time - service_time
+
+        stats['completed'] += 1
+        stats['total_system_time'] += system_time
+        stats['total_service_time'] += service_time
+        stats['total_wait_time'] += wait_time
+        stats['system_moments'].add(system_time)
+        stats['service_moments'].add(service_time)
+        stats['wait_moments'].add(wait_time)
+        stats['system_sketch'].add(system_time)
+        stats['service_sketch'].add(service_time)
+        stats['wait_sketch'].add(wait_time)
+
+        self._add_event('EXIT', exit_time,
+                        transaction_id=transaction.id,
+                        source_id=transaction.source_id,
+                        service_time=service_time,
+                        system_time=system_time)
+
+    def record_capacity_change(self, event_type: str, server_id: str, servers: int, time: float):
+        self._add_event(event_type, time, server_id=server_id, servers=servers)
+
     def record_packet_formed(self, source_id: str, packet_size: int, time: float):
         self._add_event('PACKET_FORMED', time,
                         source_id=source_id,
@@ -112,13 +206,29 @@ class Statistics:
                         server_id=server_id)
 
     def _add_event(self, event_type: str, time: float, **kwargs):
-        """Добавляет событие в историю"""
+        """Добавляет событие в историю и передает его подписчикам"""
+        if not self.keep_history and not self.listeners:
+            return
         event = {
             'type': event_type,
             'time': time,
             **kwargs
         }
-        self.event_history.append(event)
+        if self.keep_history:
+            self.event_history.append(event)
+        if self.listeners:
+            self._notify(event)
+
+    def add_listener(self, listener: Callable[[Dict], None]):
+        """Подписка на события модели по мере их возникновения"""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Dict], None]):
+        self.listeners.remove(listener)
+
+    def _notify(self, event: Dict):
+        for listener in self.listeners:
+            listener(event)
 
     def get_rejection_rate(self) -> float:
         if self.total_transactions == 0:
@@ -133,13 +243,17 @@ class Statistics:
             return {
                 'generated': 0,
                 'rejected': 0,
+                'displaced': 0,
                 'completed': 0,
                 'rejection_rate': 0.0,
                 'avg_system_time': 0.0,
                 'avg_wait_time': 0.0,
                 'avg_service_time': 0.0,
                 'var_wait_time': 0.0,
-                'var_service_time': 0.0
+                'var_service_time': 0.0,
+                'wait_time_quantiles': stats['wait_sketch'].quantiles(),
+                'service_time_quantiles': stats['service_sketch'].quantiles(),
+                'system_time_quantiles': stats['system_sketch'].quantiles()
             }
 
         rejection_rate = stats['rejected'] / generated if generated > 0 else 0.0
@@ -148,20 +262,24 @@ class Statistics:
         avg_wait_time = stats['total_wait_time'] / stats['completed'] if stats['completed'] > 0 else 0.0
         avg_service_time = stats['total_service_time'] / stats['completed'] if stats['completed'] > 0 else 0.0
 
-        var_wait_time = self._calculate_variance(stats['wait_times'], avg_wait_time) if stats['wait_times'] else 0.0
-        var_service_time = self._calculate_variance(stats['service_times'], avg_service_time) if stats[
-            'service_times'] else 0.0
+        # Дисперсия считается относительно среднего по всем завершенным заявкам
+        var_wait_time = stats['wait_moments'].variance(around=avg_wait_time)
+        var_service_time = stats['service_moments'].variance(around=avg_service_time)
 
         return {
             'generated': generated,
             'rejected': stats['rejected'],
+            'displaced': stats['displaced'],
             'completed': stats['completed'],
             'rejection_rate': rejection_rate,
             'avg_system_time': avg_system_time,
             'avg_wait_time': avg_wait_time,
             'avg_service_time': avg_service_time,
             'var_wait_time': var_wait_time,
-            'var_service_time': var_service_time
+            'var_service_time': var_service_time,
+            'wait_time_quantiles': stats['wait_sketch'].quantiles(),
+            'service_time_quantiles': stats['service_sketch'].quantiles(),
+            'system_time_quantiles': stats['system_sketch'].quantiles()
         }
 
     def get_server_statistics(self, server_id: str, total_time: float) -> Dict:
@@ -171,14 +289,35 @@ class Statistics:
         return {
             'processed': stats['processed'],
             'busy_time': stats['busy_time'],
-            'utilization': utilization
+            'utilization': utilization,
+            'wait_time_quantiles': stats['wait_sketch'].quantiles(),
+            'system_time_quantiles': stats['system_sketch'].quantiles()
         }
 
-    def _calculate_variance(self, values: List[float], mean: float) -> float:
-        if len(values) <= 1:
-            return 0.0
-        squared_diff = sum((x - mean) ** 2 for x in values)
-        return squared_diff / (len(values) - 1)
+    def get_occupancy_statistics(self, end_time: float) -> Dict:
+        return {
+            'avg_buffer_length': self.buffer_occupancy.mean(end_time),
+            'avg_in_service': self.in_service.mean(end_time),
+            'buffer_distribution': {int(k): p for k, p in self.buffer_occupancy.distribution(end_time).items()},
+            'buffer_series': self.buffer_occupancy.series(end_time),
+            'in_service_series': self.in_service.series(end_time)
+        }
+
+    def get_utilization_series(self, server_id: str, end_time: float) -> List[Dict]:
+        return self.server_stats[server_id]['busy_state'].series(end_time)
+
+    def get_saturation_windows(self, end_time: float, threshold: float = 0.95) -> List[Dict]:
+        """Окна, в которых средняя загрузка всех серверов не ниже порога"""
+        series = [self.get_utilization_series(server_id, end_time) for server_id in self.server_stats]
+        if not series:
+            return []
+
+        windows = []
+        for bins in zip(*series):
+            utilization = sum(b['mean'] for b in bins) / len(bins)
+            if utilization >= threshold:
+                windows.append({'start': bins[0]['start'], 'end': bins[0]['end'], 'utilization': utilization})
+        return windows
 
     def get_event_history(self, limit: int = None) -> List[Dict]:
         if limit:
@@ -195,3 +334,143 @@ class Statistics:
     def set_simulation_time(self, start_time: float, end_time: float):
         self.simulation_start_time = start_time
         self.simulation_end_time = end_time
+        self._advance_accumulators(end_time)
+
+    def _advance_accumulators(self, time: float):
+        # Средние по времени доводятся до конца прогона, чтобы его можно было сериализовать и объединить
+        self.buffer_occupancy.advance(time)
+        self.in_service.advance(time)
+        for stats in self.server_stats.values():
+            stats['busy_state'].advance(time)
+
+    def observed_time(self) -> float:
+        """Длительность наблюдения с учетом объединенных прогонов"""
+        return self.simulation_end_time - self.simulation_start_time + self.merged_time
+
+    def get_report(self, end_time: Optional[float] = None, server_ids: Optional[List[str]] = None) -> Dict:
+        """Сводка по источникам, серверам и заполненности; без server_ids - все серверы со статистикой"""
+        end_time = self.simulation_end_time if end_time is None else end_time
+        # Загрузка серверов - по суммарному времени наблюдения всех объединенных прогонов
+        total_time = end_time - self.simulation_start_time + self.merged_time
+        server_ids = list(self.server_stats) if server_ids is None else server_ids
+        return {
+            'total_transactions': self.total_transactions,
+            'rejected_transactions': self.rejected_transactions,
+            'rejection_rate': self.get_rejection_rate(),
+            'source_statistics': {
+                source_id: self.get_source_statistics(source_id)
+                for source_id in self.source_stats.keys()
+            },
+            'server_statistics': {
+                server_id: self.get_server_statistics(server_id, total_time)
+                for server_id in server_ids
+            },
+            'occupancy_statistics': self.get_occupancy_statistics(end_time),
+            'utilization_series': {
+                server_id: self.get_utilization_series(server_id, end_time)
+                for server_id in server_ids
+            }
+        }
+
+    def merge(self, other: 'Statistics') -> 'Statistics':
+        """Добавляет статистику другого прогона; объединение ассоциативно и не зависит от порядка"""
+        if self.window != other.window:
+            raise ValueError("Нельзя объединить статистику с разной шириной окна")
+
+        self._advance_accumulators(self.simulation_end_time)
+        other._advance_accumulators(other.simulation_end_time)
+
+        self.total_transactions += other.total_transactions
+        self.rejected_transactions += other.rejected_transactions
+        self.merged_time += other.observed_time()
+
+        for source_id, other_stats in other.source_stats.items():
+            stats = self.source_stats[source_id]
+            for key in SOURCE_COUNTERS:
+                stats[key] += other_stats[key]
+            for key in SOURCE_ACCUMULATORS:
+                stats[key].merge(other_stats[key])
+
+        for server_id, other_stats in other.server_stats.items():
+            stats = self.server_stats[server_id]
+            for key in SERVER_COUNTERS:
+                stats[key] += other_stats[key]
+            for key in SERVER_ACCUMULATORS:
+                stats[key].merge(other_stats[key])
+
+        self.buffer_occupancy.merge(other.buffer_occupancy)
+        self.in_service.merge(other.in_service)
+        return self
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': STATISTICS_VERSION,
+            'window': self.window,
+            'total_transactions': self.total_transactions,
+            'rejected_transactions': self.rejected_transactions,
+            'simulation_start_time': self.simulation_start_time,
+            'simulation_end_time': self.simulation_end_time,
+            'merged_time': self.merged_time,
+            'sources': {
+                source_id: {
+                    **{key: stats[key] for key in SOURCE_COUNTERS},
+                    **{key: stats[key].to_dict() for key in SOURCE_ACCUMULATORS}
+                }
+                for source_id, stats in self.source_stats.items()
+            },
+            'servers': {
+                server_id: {
+                    **{key: stats[key] for key in SERVER_COUNTERS},
+                    **{key: stats[key].to_dict() for key in SERVER_ACCUMULATORS}
+                }
+                for server_id, stats in self.server_stats.items()
+            },
+            'buffer_occupancy': self.buffer_occupancy.to_dict(),
+            'in_service': self.in_service.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Statistics':
+        if data.get('version') != STATISTICS_VERSION:
+            raise ValueError(f"Неподдерживаемая версия статистики: {data.get('version')}")
+
+        statistics = cls(window=data['window'], keep_history=False)
+        statistics.total_transactions = data['total_transactions']
+        statistics.rejected_transactions = data['rejected_transactions']
+        statistics.simulation_start_time = data['simulation_start_time']
+        statistics.simulation_end_time = data['simulation_end_time']
+        statistics.merged_time = data['merged_time']
+
+        for source_id, source_data in data['sources'].items():
+            stats = statistics.source_stats[source_id]
+            for key in SOURCE_COUNTERS:
+                stats[key] = source_data[key]
+            for key in ('wait_moments', 'service_moments', 'system_moments'):
+                stats[key] = Moments.from_dict(source_data[key])
+            for key in ('wait_sketch', 'service_sketch', 'system_sketch'):
+                stats[key] = QuantileSketch.from_dict(source_data[key])
+
+        for server_id, server_data in data['servers'].items():
+            stats = statistics.server_stats[server_id]
+            for key in SERVER_COUNTERS:
+                stats[key] = server_data[key]
+            stats['wait_sketch'] = QuantileSketch.from_dict(server_data['wait_sketch'])
+            stats['system_sketch'] = QuantileSketch.from_dict(server_data['system_sketch'])
+            stats['busy_state'] = TimeWeightedValue.from_dict(server_data['busy_state'])
+
+        statistics.buffer_occupancy = TimeWeightedValue.from_dict(data['buffer_occupancy'])
+        statistics.in_service = TimeWeightedValue.from_dict(data['in_service'])
+        return statistics
+
+    def dumps(self) -> str:
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, text: str) -> 'Statistics':
+        return cls.from_dict(json.loads(text))
+
+    def __getstate__(self) -> Dict:
+        # Подписчики (экспорт трасс, IPA) привязаны к своему процессу и не сериализуются
+        state = self.__dict__.copy()
+        state['listeners'] = []
+        return state
@@ -0,0 +1,121 @@
+import json
+from functools import partial
+from typing import Dict, Set, TextIO, Tuple
+from .simulation import Simulation
+
+SERVERS_PID = 1
+BUFFER_PID = 2
+DISPATCHER_TID = 1
+
+
+class ChromeTraceExporter:
+    """Потоковая запись событий модели в формате Chrome Trace Event (открывается в Perfetto).
+
+    Каждый сервер - отдельная дорожка со спаном на каждую транзакцию,
+    формирование пакета, отказы и вытеснения - мгновенные события,
+    длина очереди - дорожка-счетчик. События пишутся в файл по мере
+    возникновения, поэтому память не растет с длиной прогона, если у модели
+    отключена история событий (keep_history: false; run --trace отключает ее сам).
+    В сети этапов дорожки серверов и счетчики очередей заводятся на каждый этап.
+    """
+
+    def __init__(self, sim: Simulation, path: str, time_scale: float = 1e6):
+        self.sim = sim
+        self.path = path
+        # Единица модельного времени в микросекундах трассы
+        self.time_scale = time_scale
+        servers = [(index, server.server_id) for index, stage in enumerate(sim.stages) for server in stage.servers]
+        self.server_tids = {key: i + 1 for i, key in enumerate(servers)}
+        self.open_spans: Set[Tuple[int, str]] = set()
+        self.file: TextIO = open(path, 'w')
+        self._first = True
+
+        self.file.write('[\n')
+        self._write_metadata()
+        self.listeners = []
+        for index, stage in enumerate(sim.stages):
+            listener = partial(self.on_event, stage=index)
+            listener({'type': 'BUFFER_LEVEL', 'time': sim.current_time, 'length': len(stage.buffer)})
+            stage.statistics.add_listener(listener)
+            self.listeners.append((stage.statistics, listener))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, record: Dict):
+        if not self._first:
+            self.file.write(',\n')
+        self._first = False
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+
+    def _write_metadata(self):
+        self._write({'ph': 'M', 'name': 'process_name', 'pid': SERVERS_PID, 'args': {'name': 'Серверы'}})
+        self._write({'ph': 'M', 'name': 'process_name', 'pid': BUFFER_PID, 'args': {'name': 'Буфер и диспетчеры'}})
+        self._write({'ph': 'M', 'name': 'thread_name', 'pid': BUFFER_PID, 'tid': DISPATCHER_TID,
+                     'args': {'name': 'События'}})
+        for key, tid in self.server_tids.items():
+            self._write_server_metadata(key, tid)
+
+    def _write_server_metadata(self, key: Tuple[int, str], tid: int):
+        index, server_id = key
+        name = f"{self.sim.stages[index].stage_id}/{server_id}" if self.sim.multi_stage else server_id
+        self._write({'ph': 'M', 'name': 'thread_name', 'pid': SERVERS_PID, 'tid': tid,
+                     'args': {'name': name}})
+        self._write({'ph': 'M', 'name': 'thread_sort_index', 'pid': SERVERS_PID, 'tid': tid,
+                     'args': {'sort_index': tid}})
+
+    def _server_tid(self, stage: int, server_id: str) -> int:
+        # Серверы, запущенные автомасштабированием, получают дорожку при первом событии
+        key = (stage, server_id)
+        tid = self.server_tids.get(key)
+        if tid is None:
+            tid = self.server_tids[key] = len(self.server_tids) + 1
+            self._write_server_metadata(key, tid)
+        return tid
+
+    def _ts(self, time: float) -> float:
+        return time * self.time_scale
+
+    def _counter_name(self, stage: int) -> str:
+        return f"Очередь {self.sim.stages[stage].stage_id}" if self.sim.multi_stage else 'Очередь'
+
+    def on_event(self, event: Dict, stage: int = 0):
+        event_type = event['type']
+        ts = self._ts(event['time'])
+
+        if event_type == 'SERVICE_START':
+            self._write({'ph': 'B', 'name': event['transaction_id'], 'cat': event['source_id'],
+                         'pid': SERVERS_PID, 'tid': self._server_tid(stage, event['server_id']), 'ts': ts,
+                         'args': {'source': event['source_id'], 'wait_time': event.get('wait_time', 0.0)}})
+            self.open_spans.add((stage, event['server_id']))
+        elif event_type == 'SERVICE_END':
+            self._write({'ph': 'E', 'pid': SERVERS_PID, 'tid': self._server_tid(stage, event['server_id']), 'ts': ts,
+                         'args': {'service_time': event['service_time'], 'system_time': event['system_time']}})
+            self.open_spans.discard((stage, event['server_id']))
+        elif event_type == 'BUFFER_LEVEL':
+            self._write({'ph': 'C', 'name': self._counter_name(stage), 'pid': BUFFER_PID, 'ts': ts,
+                         'args': {'length': event['length']}})
+        elif event_type in ('PACKET_FORMED', 'REJECTED', 'DISPLACED', 'SCALE_UP', 'SCALE_DOWN',
+                            'SERVER_READY', 'SERVER_STOPPED'):
+            args = {key: value for key, value in event.items() if key not in ('type', 'time')}
+            self._write({'ph': 'i', 's': 't', 'name': event_type, 'pid': BUFFER_PID, 'tid': DISPATCHER_TID,
+                         'ts': ts, 'args': args})
+
+    def close(self):
+        if self.file.closed:
+            return
+        for statistics, listener in self.listeners:
+            statistics.remove_listener(listener)
+
+        # Незавершенные к концу прогона обслуживания закрываются моментом остановки
+        end_ts = self._ts(self.sim.current_time)
+        for key in sorted(self.open_spans):
+            self._write({'ph': 'E', 'pid': SERVERS_PID, 'tid': self.server_tids[key], 'ts': end_ts,
+                         'args': {'unfinished': True}})
+        self.open_spans.clear()
+
+        self.file.write('\n]\n')
+        self.file.close()
@@ -1,10 +1,18 @@
+import argparse
+import cProfile
+import io
 import json
-import sys
 import os
+import pstats
+import sys
+import time
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from core.simulation import Simulation
+from utils.distributions import SeedSequence
+
+COMMANDS = ('run', 'merge', 'step', 'bench', 'profile', 'rare', 'sensitivity', 'golden')
 
 
 def display_header():
@@ -21,34 +29,28 @@ def display_header():
     print("╚══════════════════════════════════════════════════════════════════════════════════════════════╝")
 
 
-def display_system_state(state, config, step):
-    print(f"\n{'═' * 100}")
-    print(f"ШАГ {step:3d} │ Время: {state['time']:7.2f} │ Транзакций: {state['statistics']['total_transactions']:3d} │ "
-          f"Отказов: {state['statistics']['rejected_transactions']:3d} │ P(отк): {state['statistics']['rejection_rate'] * 100:5.1f}%")
-    print('═' * 100)
-
-    # БУФЕР
+def display_buffer(buffer, buffer_capacity, current_time):
     print("БУФЕР (Д10З2 - FIFO):")
-    buffer_count = len(state['buffer'])
-    buffer_capacity = config['buffer_capacity']
+    buffer_count = len(buffer)
 
     filled = '█' * buffer_count
     empty = '░' * (buffer_capacity - buffer_count)
     print(f"   [{filled}{empty}] {buffer_count}/{buffer_capacity}")
 
-    if state['buffer']:
+    if buffer:
         print("   Содержимое:")
-        for i, trans in enumerate(state['buffer'][:5]):
-            wait_time = state['time'] - trans.timestamp if hasattr(trans, 'timestamp') else 0
+        for i, trans in enumerate(buffer[:5]):
+            wait_time = current_time - trans.timestamp if hasattr(trans, 'timestamp') else 0
             print(f"     {i + 1:2d}. {trans.id:8} (от {trans.source_id:2}, ждет: {wait_time:5.2f})")
-        if len(state['buffer']) > 5:
-            print(f"     ... и ещё {len(state['buffer']) - 5} транзакций")
+        if len(buffer) > 5:
+            print(f"     ... и ещё {len(buffer) - 5} транзакций")
     else:
         print("   (пусто)")
 
-    # СЕРВЕРЫ
+
+def display_servers(servers):
     print(f"\nСЕРВЕРЫ (Д2П1 - приоритет по номеру):")
-    for server in state['servers']:
+    for server in servers:
         status = "🟢 Свободен" if not server['busy'] else "🔴 Занят"
         if server['current_transaction']:
             trans_id = server['current_transaction']
@@ -57,6 +59,23 @@ def display_system_state(state, config, step):
         else:
             print(f"   {server['id']:8} - {status:12}")
 
+
+def display_system_state(state, config, step):
+    print(f"\n{'═' * 100}")
+    print(f"ШАГ {step:3d} │ Время: {state['time']:7.2f} │ Транзакций: {state['statistics']['total_transactions']:3d} │ "
+          f"Отказов: {state['statistics']['rejected_transactions']:3d} │ P(отк): {state['statistics']['rejection_rate'] * 100:5.1f}%")
+    print('═' * 100)
+
+    if len(state['stages']) > 1:
+        # Сеть этапов: буфер и серверы каждого этапа, пакет - у входного этапа
+        for stage in state['stages']:
+            print(f"\nЭТАП {stage['id']}")
+            display_buffer(stage['buffer'], stage['buffer_capacity'], state['time'])
+            display_servers(stage['servers'])
+    else:
+        display_buffer(state['buffer'], state['buffer_capacity'], state['time'])
+        display_servers(state['servers'])
+
     # ПАКЕТНАЯ ОБРАБОТКА (Д2Б5)
     if state['current_packet_source']:
         print(f"\nАКТИВНЫЙ ПАКЕТ (Д2Б5 - приоритет по источнику):")
@@ -111,6 +130,8 @@ def display_event_calendar(events, current_time):
             description = f"Направлена на сервер {event.get('server_id', '')}"
         elif e_type == 'REJECTED':
             description = f"ОТКАЗ (Д10О5) - буфер полон"
+        elif e_type == 'DISPLACED':
+            description = f"ВЫТЕСНЕНА заявкой {event.get('displaced_by', '')}"
         elif e_type == 'SERVICE_START':
             wait = event.get('wait_time', 0)
             description = f"Начало обработки (ожидание: {wait:.2f})"
@@ -137,6 +158,19 @@ def display_automated_results(sim, config):
     print(f"   • Отказов: {sim.statistics.rejected_transactions}")
     print(f"   • Вероятность отказа: {sim.statistics.get_rejection_rate() * 100:.1f}%")
 
+    # В сети этапов очередь и насыщение показываются для входного этапа, остальные - в таблице 2А
+    entry_statistics = sim.stages[sim.entry_stage].statistics
+    occupancy = entry_statistics.get_occupancy_statistics(sim.current_time)
+    print(f"   • Средняя длина очереди: {occupancy['avg_buffer_length']:.2f}")
+    print(f"   • Среднее число заявок на обслуживании: {occupancy['avg_in_service']:.2f}")
+    distribution = ', '.join(f"{k}: {p * 100:.1f}%" for k, p in occupancy['buffer_distribution'].items())
+    print(f"   • P(буфер = k): {distribution}")
+    saturated = entry_statistics.get_saturation_windows(sim.current_time)
+    print(f"   • Окон насыщения (загрузка ≥ 95%): {len(saturated)} из {len(occupancy['buffer_series'])}")
+    capacity = sim.get_capacity_statistics()
+    average_servers = sum(stage['avg_servers'] for stage in capacity['stages'].values())
+    print(f"   • Серверо-часы: {capacity['server_hours']:.3f} (в среднем серверов: {average_servers:.2f})")
+
     # ТАБЛИЦА 1: Источники
     print("\n" + "─" * 90)
     print("ТАБЛИЦА 1: ХАРАКТЕРИСТИКИ ИСТОЧНИКОВ")
@@ -179,23 +213,64 @@ def display_automated_results(sim, config):
 
     total_processed = 0
     total_busy = 0
+    total_servers = 0
 
-    for server in config['servers']:
-        server_id = server['id']
-        stats = sim.statistics.get_server_statistics(server_id, sim.current_time)
-        total_processed += stats['processed']
-        total_busy += stats['busy_time']
+    for stage in sim.stages:
+        for server_id in stage.server_ids():
+            stats = stage.statistics.get_server_statistics(server_id, sim.current_time)
+            total_processed += stats['processed']
+            total_busy += stats['busy_time']
+            total_servers += 1
 
-        utilization = (stats['busy_time'] / sim.current_time * 100) if sim.current_time > 0 else 0
-        print(f"{server_id:<10} {stats['processed']:<12} {stats['busy_time']:<14.2f} {utilization:<10.1f}")
+            utilization = (stats['busy_time'] / sim.current_time * 100) if sim.current_time > 0 else 0
+            label = f"{stage.stage_id}/{server_id}" if sim.multi_stage else server_id
+            print(f"{label:<10} {stats['processed']:<12} {stats['busy_time']:<14.2f} {utilization:<10.1f}")
 
-    avg_utilization = (total_busy / sim.current_time / len(config['servers']) * 100) if sim.current_time > 0 else 0
+    avg_utilization = (total_busy / sim.current_time / total_servers * 100) if sim.current_time > 0 else 0
     print("─" * 60)
     print(f"{'СРЕДНЕЕ':<10} {total_processed:<12} {total_busy:<14.2f} {avg_utilization:<10.1f}")
 
+    if sim.multi_stage:
+        display_stage_statistics(sim)
+
+    # ТАБЛИЦА 3: Квантили времени ожидания и пребывания
+    print("\n" + "─" * 90)
+    print("ТАБЛИЦА 3: КВАНТИЛИ ВРЕМЕНИ ОЖИДАНИЯ И ПРЕБЫВАНИЯ")
+    print("─" * 90)
+    print(f"{'Источник':<8} {'Tож p50':<9} {'Tож p95':<9} {'Tож p99':<9} "
+          f"{'Tпреб p50':<10} {'Tпреб p90':<10} {'Tпреб p95':<10} {'Tпреб p99':<10}")
+    print("─" * 90)
+
+    for source_id in sorted(sim.statistics.source_stats.keys()):
+        stats = sim.statistics.get_source_statistics(source_id)
+        wait_q = stats['wait_time_quantiles']
+        system_q = stats['system_time_quantiles']
+        print(f"{source_id:<8} {wait_q['p50']:<9.2f} {wait_q['p95']:<9.2f} {wait_q['p99']:<9.2f} "
+              f"{system_q['p50']:<10.2f} {system_q['p90']:<10.2f} {system_q['p95']:<10.2f} {system_q['p99']:<10.2f}")
+
     return avg_utilization, sim.statistics.get_rejection_rate()
 
 
+def display_stage_statistics(sim):
+    stage_statistics = sim.get_stage_statistics()
+
+    print("\n" + "─" * 80)
+    print("ТАБЛИЦА 2А: ЭТАПЫ ПРОВЕРКИ")
+    print("─" * 80)
+    print(f"{'Этап':<14} {'Поступило':<10} {'Отк.':<6} {'Pотк,%':<8} {'Завершено':<10} "
+          f"{'Tож':<8} {'Lоч':<8} {'Кисп max,%':<10}")
+    print("─" * 80)
+
+    for stage_id, stats in stage_statistics['stages'].items():
+        print(f"{stage_id:<14} {stats['arrivals']:<10} {stats['rejected']:<6} "
+              f"{stats['rejection_rate'] * 100:<8.1f} {stats['completed']:<10} "
+              f"{stats['avg_wait_time']:<8.2f} {stats['avg_buffer_length']:<8.2f} "
+              f"{stats['max_utilization'] * 100:<10.1f}")
+
+    print("─" * 80)
+    print(f"Узкое место: {stage_statistics['bottleneck']}")
+
+
 '''def display_economic_analysis(config, utilization, rejection_rate):
     print("\n" + "═" * 100)
     print("ЭКОНОМИЧЕСКОЕ ОБОСНОВАНИЕ")
@@ -253,13 +328,201 @@ def display_automated_results(sim, config):
         print(f"\n   ✅ Загрузка серверов оптимальна ({utilization * 100:.1f}%)")
 '''
 
-def main():
+def load_config(path):
     try:
-        with open('config.json', 'r') as f:
-            config = json.load(f)
+        with open(path, 'r') as f:
+            return json.load(f)
     except FileNotFoundError:
-        print("❌ ОШИБКА: Файл config.json не найден!")
-        return
+        print(f"ОШИБКА: Файл {path} не найден!", file=sys.stderr)
+        return None
+
+
+def collect_results(sim, config):
+    entry = sim.stages[sim.entry_stage]
+    results = {
+        'simulation_time': sim.current_time,
+        'seed': str(sim.seed),
+        **sim.statistics.get_report(sim.current_time, [] if sim.multi_stage else entry.server_ids())
+    }
+    if sim.multi_stage:
+        # Серверы - в статистике своих этапов, ключ "этап/сервер": id серверов разных этапов могут совпадать
+        # Заполненность показывается для входного этапа
+        for stage in sim.stages:
+            for server_id in stage.server_ids():
+                key = f"{stage.stage_id}/{server_id}"
+                results['server_statistics'][key] = stage.statistics.get_server_statistics(
+                    server_id, sim.current_time)
+                results['utilization_series'][key] = stage.statistics.get_utilization_series(
+                    server_id, sim.current_time)
+        results['occupancy_statistics'] = entry.statistics.get_occupancy_statistics(sim.current_time)
+        results['stage_statistics'] = sim.get_stage_statistics()
+    results['capacity_statistics'] = sim.get_capacity_statistics()
+    return results
+
+
+def format_text(data, prefix=''):
+    """Плоский формат key=value, по одной строке на значение"""
+    lines = []
+    if isinstance(data, dict):
+        for key, value in data.items():
+            lines.extend(format_text(value, f"{prefix}{key}."))
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            lines.extend(format_text(value, f"{prefix}{i}."))
+    else:
+        lines.append(f"{prefix[:-1]}={data}")
+    return lines
+
+
+def write_output(data, output_path, output_format):
+    if output_format == 'json':
+        text = json.dumps(data, indent=2)
+    else:
+        text = '\n'.join(format_text(data))
+
+    if output_path in (None, '-'):
+        print(text)
+    else:
+        with open(output_path, 'w') as f:
+            f.write(text + '\n')
+
+
+def run_simulation(config, stop, accuracy, confidence, seed=None, trace=None, progress=None):
+    if trace:
+        # Трасса пишется потоком; история событий в памяти свела бы это на нет
+        config = dict(config, keep_history=False)
+
+    sim = Simulation(config, verbose=False, seed=seed)
+
+    exporter = None
+    if trace:
+        from core.trace_export import ChromeTraceExporter
+
+        exporter = ChromeTraceExporter(sim, trace)
+    sim.progress = progress
+
+    try:
+        sim.running = True
+        if stop == 'auto':
+            sim.run_automated(target_accuracy=accuracy, confidence=confidence, log=False)
+        else:
+            while sim.run_step():
+                pass
+    finally:
+        if exporter:
+            exporter.close()
+
+    if progress:
+        progress.report(sim)
+
+    sim.statistics.set_simulation_time(0.0, sim.current_time)
+    for stage in sim.stages:
+        stage.statistics.set_simulation_time(0.0, sim.current_time)
+    return sim
+
+
+def prepare_config(args, keep_history=False):
+    """История событий нужна только пошаговому режиму; остальные команды ее не читают"""
+    config = load_config(args.config)
+    if config is None:
+        return None
+    if getattr(args, 'time', None) is not None:
+        config['simulation_time'] = args.time
+    if not keep_history:
+        config['keep_history'] = False
+    return config
+
+
+def command_run(args):
+    config = prepare_config(args)
+    if config is None:
+        return 1
+
+    progress_file = None
+    progress = None
+    if args.progress:
+        from core.progress import ProgressReporter
+
+        if args.progress_output != '-':
+            progress_file = open(args.progress_output, 'w')
+        progress = ProgressReporter(args.progress, clock=args.progress_clock, output=progress_file,
+                                    json_lines=progress_file is not None, confidence=args.confidence)
+
+    try:
+        sim = run_simulation(config, args.stop, args.accuracy, args.confidence, args.seed, args.trace,
+                             progress)
+    finally:
+        if progress_file:
+            progress_file.close()
+
+    if args.save_statistics:
+        with open(args.save_statistics, 'w') as f:
+            f.write(dump_statistics(sim.statistics, {stage.stage_id: stage.statistics for stage in sim.stages},
+                                    sim.stages[sim.entry_stage].stage_id if sim.multi_stage else None))
+
+    write_output(collect_results(sim, config), args.output, args.format)
+    return 0
+
+
+def dump_statistics(statistics, stages, entry_stage=None):
+    """JSON статистики прогона; для сети этапов - общая статистика и статистика каждого этапа"""
+    if entry_stage is None:
+        return statistics.dumps()
+    return json.dumps({
+        'network': statistics.to_dict(),
+        'entry_stage': entry_stage,
+        'stages': {stage_id: stage_statistics.to_dict() for stage_id, stage_statistics in stages.items()}
+    }, separators=(',', ':'))
+
+
+def load_statistics(text):
+    """(общая статистика, статистика этапов, входной этап); у одноэтапной модели этапов нет"""
+    from core.statistics import Statistics
+
+    data = json.loads(text)
+    if 'network' not in data:
+        return Statistics.from_dict(data), {}, None
+    stages = {stage_id: Statistics.from_dict(stage_data) for stage_id, stage_data in data['stages'].items()}
+    return Statistics.from_dict(data['network']), stages, data['entry_stage']
+
+
+def command_merge(args):
+    merged = stages = entry_stage = None
+    for path in args.paths:
+        with open(path) as f:
+            statistics, run_stages, run_entry = load_statistics(f.read())
+        if merged is None:
+            merged, stages, entry_stage = statistics, run_stages, run_entry
+            continue
+        if set(run_stages) != set(stages) or run_entry != entry_stage:
+            print(f"ОШИБКА: {path}: этапы модели не совпадают с предыдущими файлами", file=sys.stderr)
+            return 1
+        merged.merge(statistics)
+        for stage_id, stage_statistics in run_stages.items():
+            stages[stage_id].merge(stage_statistics)
+
+    if args.save_statistics:
+        with open(args.save_statistics, 'w') as f:
+            f.write(dump_statistics(merged, stages, entry_stage))
+
+    results = {'runs': len(args.paths), 'observed_time': merged.observed_time(),
+               **merged.get_report(server_ids=[] if stages else None)}
+    # Как в collect_results: серверы этапов с ключом "этап/сервер", заполненность - входного этапа
+    for stage_id, stage_statistics in stages.items():
+        report = stage_statistics.get_report()
+        for key in ('server_statistics', 'utilization_series'):
+            for server_id, value in report[key].items():
+                results[key][f"{stage_id}/{server_id}"] = value
+        if stage_id == entry_stage:
+            results['occupancy_statistics'] = report['occupancy_statistics']
+    write_output(results, args.output, args.format)
+    return 0
+
+
+def command_step(args):
+    config = prepare_config(args, keep_history=True)
+    if config is None:
+        return 1
 
     display_header()
 
@@ -268,7 +531,7 @@ def main():
     print("Команды: Enter - следующий шаг, q - выход, a - автоматический режим")
     print(f"{'─' * 50}")
 
-    sim_step = Simulation(config, verbose=False)
+    sim_step = Simulation(config, verbose=False, seed=args.seed)
     sim_step.running = True
     step_count = 0
 
@@ -295,15 +558,15 @@ def main():
 
             step_count += 1
 
-            # Ограничиваем пошаговый режим 50 шагами
-            if step_count >= 50:
-                print("\n⚠️  Достигнуто максимальное количество шагов (50)")
+            # Ограничиваем пошаговый режим заданным числом шагов
+            if step_count >= args.max_steps:
+                print(f"\n⚠️  Достигнуто максимальное количество шагов ({args.max_steps})")
                 print("   Переход к автоматическому режиму...")
                 break
 
     except KeyboardInterrupt:
         print("\n\nПрервано пользователем")
-        return
+        return 130
 
     # Автоматический режим
     print(f"\n{'─' * 50}")
@@ -311,7 +574,7 @@ def main():
     print("Выполняется симуляция с точностью 10% и доверительной вероятностью 90%...")
     print(f"{'─' * 50}")
 
-    sim_auto = Simulation(config, verbose=False)
+    sim_auto = Simulation(config, verbose=False, seed=args.seed)
     sim_auto.running = True
     sim_auto.run_automated(target_accuracy=0.1, confidence=0.9)
 
@@ -321,29 +584,217 @@ def main():
 
     '''display_economic_analysis(config, utilization, rejection_rate)'''
 
-    results = {
-        'simulation_time': sim_auto.current_time,
-        'total_transactions': sim_auto.statistics.total_transactions,
-        'rejected_transactions': sim_auto.statistics.rejected_transactions,
-        'rejection_rate': sim_auto.statistics.get_rejection_rate(),
-        'source_statistics': {
-            source_id: sim_auto.statistics.get_source_statistics(source_id)
-            for source_id in sim_auto.statistics.source_stats.keys()
-        },
-        'server_statistics': {
-            server['id']: sim_auto.statistics.get_server_statistics(server['id'], sim_auto.current_time)
-            for server in config['servers']
-        }
-    }
-
-    with open('simulation_results.json', 'w') as f:
-        json.dump(results, f, indent=2)
+    with open(args.output, 'w') as f:
+        json.dump(collect_results(sim_auto, config), f, indent=2)
 
-    print(f"\nРезультаты сохранены в simulation_results.json")
+    print(f"\nРезультаты сохранены в {args.output}")
     print("=" * 100)
     print("Программа успешно завершена!")
     print("=" * 100)
+    return 0
+
+
+def command_bench(args):
+    config = prepare_config(args)
+    if config is None:
+        return 1
+
+    started = time.perf_counter()
+    if args.engine == 'batch':
+        from core.batch import BatchSimulation
+
+        batch = BatchSimulation(config, args.replications, seed=args.seed)
+        batch.run()
+        seed = batch.seed
+        events = batch.events_processed
+        rejection_rate = batch.get_results()['rejection_rate']['mean']
+    else:
+        # Реплики получают независимые подпотоки одного корневого зерна
+        root = SeedSequence(args.seed)
+        seed = root.entropy
+        events = 0
+        rates = []
+        for replica in range(args.replications):
+            sim = Simulation(config, verbose=False, seed=root.spawn('replica', replica))
+            sim.running = True
+            while sim.run_step():
+                events += 1
+            rates.append(sim.statistics.get_rejection_rate())
+        rejection_rate = sum(rates) / len(rates) if rates else 0.0
+    elapsed = time.perf_counter() - started
+
+    write_output({
+        'engine': args.engine,
+        'seed': seed,
+        'replications': args.replications,
+        'events': events,
+        'seconds': elapsed,
+        'events_per_sec': events / elapsed if elapsed > 0 else 0.0,
+        'rejection_rate': rejection_rate
+    }, args.output, args.format)
+    return 0
+
+
+def command_profile(args):
+    config = prepare_config(args)
+    if config is None:
+        return 1
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    run_simulation(config, args.stop, args.accuracy, args.confidence, args.seed)
+    profiler.disable()
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(args.sort).print_stats(args.limit)
+    if args.output in (None, '-'):
+        print(stream.getvalue())
+    else:
+        with open(args.output, 'w') as f:
+            f.write(stream.getvalue())
+    return 0
+
+
+def command_rare(args):
+    config = prepare_config(args)
+    if config is None:
+        return 1
+
+    from core.rare_event import SplittingEstimator
+
+    estimator = SplittingEstimator(config, levels=args.levels, effort=args.effort, pilot_cycles=args.pilot_cycles,
+                                   seed=args.seed)
+    write_output(estimator.run(confidence=args.confidence, replications=args.replications),
+                 args.output, args.format)
+    return 0
+
+
+def command_sensitivity(args):
+    config = prepare_config(args)
+    if config is None:
+        return 1
+
+    from core.sensitivity import SensitivityAnalysis
+
+    analysis = SensitivityAnalysis(config, seed=0 if args.seed is None else args.seed,
+                                   replications=args.replications, relative_step=args.step,
+                                   absolute_step=args.absolute_step)
+    write_output(analysis.run(confidence=args.confidence), args.output, args.format)
+    return 0
+
+
+def command_golden(args):
+    from core import golden
+
+    engine = golden.ENGINES[args.engine]
+    if args.action == 'record':
+        golden.save(golden.record(engine), args.path)
+        print(f"golden={args.path}")
+        return 0
+
+    report = golden.compare(golden.load(args.path), engine, tolerance=args.tolerance)
+    write_output(report, args.output, args.format)
+    return 0 if all(result['passed'] for result in report.values()) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Имитационная модель системы антифрод-верификации транзакций")
+    subparsers = parser.add_subparsers(dest='command')
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', default='config.json', help="путь к файлу конфигурации")
+    common.add_argument('--seed', type=int, default=None, help="зерно генератора случайных чисел")
+    common.add_argument('--time', type=float, default=None, help="переопределить simulation_time")
+
+    stopping = argparse.ArgumentParser(add_help=False)
+    stopping.add_argument('--stop', choices=['auto', 'time'], default='auto',
+                          help="правило остановки: auto - по точности P(отк), time - до simulation_time")
+    stopping.add_argument('--accuracy', type=float, default=0.1, help="требуемая относительная точность")
+    stopping.add_argument('--confidence', type=float, default=0.9, help="доверительная вероятность")
+
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--output', '-o', default='-', help="файл результатов ('-' - stdout)")
+    output.add_argument('--format', choices=['text', 'json'], default='text', help="формат вывода")
+
+    run_parser = subparsers.add_parser('run', parents=[common, stopping, output], help="неинтерактивный прогон")
+    run_parser.add_argument('--trace', default=None,
+                            help="записать временные диаграммы в формате Chrome Trace / Perfetto (JSON)")
+    run_parser.add_argument('--progress', type=float, default=None,
+                            help="интервал снимков прогресса (секунды реального или модельного времени)")
+    run_parser.add_argument('--progress-clock', choices=['wall', 'virtual'], default='wall',
+                            help="часы для интервала прогресса")
+    run_parser.add_argument('--progress-output', default='-',
+                            help="'-' - текст в stderr, иначе файл JSON lines")
+    run_parser.add_argument('--save-statistics', default=None,
+                            help="сохранить статистику прогона в JSON для последующего объединения")
+    run_parser.set_defaults(handler=command_run)
+
+    merge_parser = subparsers.add_parser('merge', parents=[output],
+                                         help="объединить статистику, сохраненную прогонами run --save-statistics")
+    merge_parser.add_argument('paths', nargs='+', help="файлы статистики")
+    merge_parser.add_argument('--save-statistics', default=None, help="сохранить объединенную статистику")
+    merge_parser.set_defaults(handler=command_merge)
+
+    step_parser = subparsers.add_parser('step', parents=[common], help="пошаговый режим (ОД3) и сводка (ОР1)")
+    step_parser.add_argument('--max-steps', type=int, default=50, help="максимум шагов в пошаговом режиме")
+    step_parser.add_argument('--output', '-o', default='simulation_results.json', help="файл результатов")
+    step_parser.set_defaults(handler=command_step)
+
+    bench_parser = subparsers.add_parser('bench', parents=[common, output], help="замер производительности")
+    bench_parser.add_argument('--replications', '-n', type=int, default=10, help="число реплик")
+    bench_parser.add_argument('--engine', choices=['sequential', 'batch'], default='sequential',
+                              help="движок: sequential - Simulation, batch - BatchSimulation (NumPy)")
+    bench_parser.set_defaults(handler=command_bench)
+
+    profile_parser = subparsers.add_parser('profile', parents=[common, stopping], help="профилирование прогона")
+    profile_parser.add_argument('--sort', default='cumulative', help="ключ сортировки pstats")
+    profile_parser.add_argument('--limit', type=int, default=25, help="число строк отчета")
+    profile_parser.add_argument('--output', '-o', default='-', help="файл отчета ('-' - stdout)")
+    profile_parser.set_defaults(handler=command_profile)
+
+    rare_parser = subparsers.add_parser('rare', parents=[common, output],
+                                        help="оценка малой вероятности отказа методом расщепления")
+    rare_parser.add_argument('--effort', type=int, default=200, help="траекторий на каждом уровне")
+    rare_parser.add_argument('--levels', type=int, nargs='+', default=None,
+                             help="уровни длины очереди (по умолчанию 1..buffer_capacity)")
+    rare_parser.add_argument('--pilot-cycles', type=int, default=2000, help="циклов в пробном прогоне")
+    rare_parser.add_argument('--replications', type=int, default=5, help="независимых повторений оценки")
+    rare_parser.add_argument('--confidence', type=float, default=0.9, help="доверительная вероятность")
+    rare_parser.set_defaults(handler=command_rare)
+
+    sensitivity_parser = subparsers.add_parser('sensitivity', parents=[common, output],
+                                               help="производные P(отк) и ожидания по параметрам модели")
+    sensitivity_parser.add_argument('--replications', type=int, default=10, help="независимых реплик")
+    sensitivity_parser.add_argument('--step', type=float, default=0.05,
+                                    help="относительный шаг конечных разностей")
+    sensitivity_parser.add_argument('--absolute-step', type=float, default=0.01,
+                                    help="наименьший шаг (для параметров, равных нулю)")
+    sensitivity_parser.add_argument('--confidence', type=float, default=0.9, help="доверительная вероятность")
+    sensitivity_parser.set_defaults(handler=command_sensitivity)
+
+    golden_parser = subparsers.add_parser('golden', parents=[output],
+                                          help="эталонные трассы для проверки эквивалентности движков")
+    golden_parser.add_argument('action', choices=['record', 'check'], help="записать эталон или сверить с ним")
+    golden_parser.add_argument('--path', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              'golden_traces.json.gz'),
+                               help="файл эталонных трасс")
+    golden_parser.add_argument('--engine', choices=['sequential', 'parallel'], default='sequential',
+                               help="проверяемый движок")
+    golden_parser.add_argument('--tolerance', type=float, default=0.0,
+                               help="допуск при сравнении времен (0 - точное совпадение)")
+    golden_parser.set_defaults(handler=command_golden)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    argv = sys.argv[1:] if argv is None else argv
+    # Без подкоманды сохраняется прежнее поведение: пошаговый режим
+    args = parser.parse_args(argv if argv and argv[0] in COMMANDS + ('-h', '--help')
+                             else ['step'] + list(argv))
+    return args.handler(args)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
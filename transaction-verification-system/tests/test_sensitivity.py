@@ -0,0 +1,42 @@
+import math
+import unittest
+from core.sensitivity import SensitivityAnalysis
+
+
+def make_config():
+    return {
+        'simulation_time': 200.0,
+        'buffer_capacity': 3,
+        'sources': [
+            {'id': 'S1', 'priority': 1, 'lambda': 0.5},
+            {'id': 'S2', 'priority': 2, 'lambda': 0.0}
+        ],
+        'servers': [
+            {'id': 'Server1', 'min_time': 0.0, 'max_time': 2.0},
+            {'id': 'Server2', 'min_time': 1.0, 'max_time': 3.0}
+        ]
+    }
+
+
+class ZeroParameterTest(unittest.TestCase):
+    def test_zero_parameters_get_absolute_forward_step(self):
+        analysis = SensitivityAnalysis(make_config(), seed=1, replications=2, absolute_step=0.01)
+        parameters = {name: (kind, step) for name, _, kind, step in analysis.parameters()}
+
+        self.assertEqual(parameters['sources.S2.lambda'], ('forward', 0.01))
+        self.assertEqual(parameters['servers.Server1.min_time'], ('forward', 0.01))
+        self.assertEqual(parameters['sources.S1.lambda'][0], 'central')
+        self.assertTrue(all(step > 0 for _, step in parameters.values()))
+
+    def test_run_with_zero_parameters(self):
+        result = SensitivityAnalysis(make_config(), seed=1, replications=2).run()
+
+        for name in ('sources.S2.lambda', 'servers.Server1.min_time'):
+            derivative = result['finite_differences'][name]
+            self.assertEqual(derivative['difference'], 'forward')
+            for metric in ('rejection_rate', 'avg_wait_time', 'avg_system_time'):
+                self.assertTrue(math.isfinite(derivative[metric]['estimate']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,60 @@
 import random
 import math
+import secrets
+from typing import Optional, Tuple, Union
 
-def exponential(rate: float) -> float:
+def exponential(rate: float, rng: Optional[random.Random] = None) -> float:
     """Генерация времени по экспоненциальному распределению"""
     if rate <= 0:
         return float('inf')
-    return -math.log(1.0 - random.random()) / rate
\ No newline at end of file
+    return -math.log(1.0 - (rng or random).random()) / rate
+
+
+class SeedSequence:
+    """Дерево независимых потоков случайных чисел (аналог numpy.random.SeedSequence).
+
+    Зерно потомка - путь от корневого зерна, например "42/replica/3", а поток
+    строится хешированием пути. Поток сущности зависит только от корня и своего
+    пути: добавление источника не меняет потоки остальных, а spawn дает
+    независимые подпотоки для реплик, рабочих процессов и клонов траекторий.
+    """
+
+    def __init__(self, entropy: Optional[int] = None, path: Tuple[str, ...] = ()):
+        self.entropy = secrets.randbits(63) if entropy is None else entropy
+        self.path = tuple(str(key) for key in path)
+
+    def spawn(self, *keys) -> 'SeedSequence':
+        return SeedSequence(self.entropy, self.path + tuple(str(key) for key in keys))
+
+    def stream(self, *keys) -> random.Random:
+        return random.Random(str(self.spawn(*keys)))
+
+    def __str__(self) -> str:
+        return '/'.join((str(self.entropy),) + self.path)
+
+    def __repr__(self) -> str:
+        return f"SeedSequence({str(self)!r})"
+
+
+Seed = Union[int, str, SeedSequence]
+
+
+def source_stream(seed: Optional[Seed], source_id: str) -> Optional[random.Random]:
+    """Отдельный поток случайных чисел источника (None - общий модуль random)"""
+    if seed is None:
+        return None
+    return random.Random(f"{seed}/source/{source_id}")
+
+
+def server_stream(seed: Optional[Seed], server_id: str) -> Optional[random.Random]:
+    """Отдельный поток случайных чисел сервера (None - общий модуль random)"""
+    if seed is None:
+        return None
+    return random.Random(f"{seed}/server/{server_id}")
+
+
+def routing_stream(seed: Optional[Seed], stage_id: str) -> Optional[random.Random]:
+    """Отдельный поток случайных чисел маршрутизации после этапа (None - общий модуль random)"""
+    if seed is None:
+        return None
+    return random.Random(f"{seed}/routing/{stage_id}")
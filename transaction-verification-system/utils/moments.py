@@ -0,0 +1,62 @@
+import math
+from typing import Dict, Optional
+
+
+class Moments:
+    """Число наблюдений, среднее и сумма квадратов отклонений без хранения выборки.
+
+    Значения добавляются по Уэлфорду, объединение - по формуле Чана, поэтому
+    накопители отдельных прогонов сливаются точно и в любом порядке.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Moments'):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self, around: Optional[float] = None) -> float:
+        """Несмещенная дисперсия; around - центр вместо выборочного среднего"""
+        if self.count <= 1:
+            return 0.0
+        m2 = self.m2
+        if around is not None:
+            m2 += self.count * (self.mean - around) ** 2
+        return m2 / (self.count - 1)
+
+    def to_dict(self) -> Dict:
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min if self.count else None, 'max': self.max if self.count else None}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Moments':
+        moments = cls()
+        moments.count = data['count']
+        moments.mean = data['mean']
+        moments.m2 = data['m2']
+        if moments.count:
+            moments.min = data['min']
+            moments.max = data['max']
+        return moments
@@ -0,0 +1,112 @@
+import math
+from typing import Dict, Iterable, Optional
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class QuantileSketch:
+    """Потоковая оценка квантилей с относительной погрешностью (DDSketch).
+
+    Значения раскладываются по логарифмическим корзинам, поэтому память
+    ограничена max_bins, а два скетча с одинаковой точностью сливаются точно.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048, min_value: float = 1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy должна быть в интервале (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+        if value <= self.min_value:
+            self.zero_count += 1
+            return
+
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def merge(self, other: 'QuantileSketch'):
+        if not math.isclose(self.gamma, other.gamma):
+            raise ValueError("Нельзя объединить скетчи с разной точностью")
+
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def to_dict(self) -> Dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_bins': self.max_bins,
+            'min_value': self.min_value,
+            'bins': [[key, count] for key, count in sorted(self.bins.items())],
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'QuantileSketch':
+        sketch = cls(data['relative_accuracy'], data['max_bins'], data['min_value'])
+        sketch.bins = {key: count for key, count in data['bins']}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        if sketch.count:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        if not 0 <= q <= 1:
+            raise ValueError("Квантиль должен быть в интервале [0, 1]")
+
+        rank = q * (self.count - 1)
+        cumulative = self.zero_count
+        if rank < cumulative:
+            return max(self.min, 0.0)
+
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if rank < cumulative:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+
+        return self.max
+
+    def quantiles(self, qs: Optional[Iterable[float]] = None) -> Dict[str, float]:
+        qs = DEFAULT_QUANTILES if qs is None else qs
+        return {f"p{round(q * 100):g}": self.quantile(q) for q in qs}
+
+    def _collapse(self):
+        # Сливаем младшие корзины: погрешность растет только для малых значений,
+        # а хвосты (p95/p99) остаются точными
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.bins[target] += self.bins.pop(key)
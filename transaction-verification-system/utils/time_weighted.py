@@ -0,0 +1,122 @@
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+
+class TimeWeightedValue:
+    """Накопитель среднего по времени для кусочно-постоянной величины.
+
+    Обновляется только в моменты изменения состояния и хранит площадь под
+    графиком, время пребывания в каждом значении и площади по окнам ширины window.
+    Накопители реплик с общим началом отсчета объединяются через merge: средние
+    берутся по суммарному времени наблюдения, окна - по числу реплик.
+    """
+
+    def __init__(self, start_time: float = 0.0, initial: float = 0, window: Optional[float] = None):
+        self.start_time = start_time
+        self.last_time = start_time
+        self.value = initial
+        self.window = window
+
+        self.area = 0.0
+        self.durations: Dict[float, float] = defaultdict(float)
+        self.window_area: Dict[int, float] = defaultdict(float)
+        self.merged_time = 0.0
+        self.replicas = 1
+
+    def update(self, time: float, value: float):
+        self.advance(time)
+        self.value = value
+
+    def add(self, time: float, delta: float):
+        self.update(time, self.value + delta)
+
+    def advance(self, time: float):
+        dt = time - self.last_time
+        if dt <= 0:
+            return
+
+        self.durations[self.value] += dt
+        if self.value:
+            self.area += self.value * dt
+            if self.window:
+                self._accumulate_windows(self.last_time, time)
+        self.last_time = time
+
+    def _accumulate_windows(self, start: float, end: float):
+        index = int(start // self.window)
+        while start < end:
+            window_end = min((index + 1) * self.window, end)
+            self.window_area[index] += self.value * (window_end - start)
+            start = window_end
+            index += 1
+
+    def observed_time(self) -> float:
+        return self.last_time - self.start_time + self.merged_time
+
+    def mean(self, end_time: float) -> float:
+        self.advance(end_time)
+        total = self.observed_time()
+        return self.area / total if total > 0 else 0.0
+
+    def distribution(self, end_time: float) -> Dict[float, float]:
+        self.advance(end_time)
+        total = self.observed_time()
+        if total <= 0:
+            return {}
+        return {value: duration / total for value, duration in sorted(self.durations.items())}
+
+    def series(self, end_time: float) -> List[Dict]:
+        if not self.window:
+            return []
+        self.advance(end_time)
+
+        result = []
+        count = math.ceil(end_time / self.window)
+        for index in range(int(self.start_time // self.window), count):
+            start = max(index * self.window, self.start_time)
+            end = min((index + 1) * self.window, end_time)
+            if end <= start:
+                continue
+            result.append({
+                'start': start,
+                'end': end,
+                'mean': self.window_area.get(index, 0.0) / ((end - start) * self.replicas)
+            })
+        return result
+
+    def merge(self, other: 'TimeWeightedValue'):
+        if self.window != other.window:
+            raise ValueError("Нельзя объединить накопители с разной шириной окна")
+
+        self.area += other.area
+        for value, duration in other.durations.items():
+            self.durations[value] += duration
+        for index, area in other.window_area.items():
+            self.window_area[index] += area
+        self.merged_time += other.observed_time()
+        self.replicas += other.replicas
+
+    def to_dict(self) -> Dict:
+        return {
+            'start_time': self.start_time,
+            'last_time': self.last_time,
+            'value': self.value,
+            'window': self.window,
+            'area': self.area,
+            'durations': [[value, duration] for value, duration in sorted(self.durations.items())],
+            'window_area': [[index, area] for index, area in sorted(self.window_area.items())],
+            'merged_time': self.merged_time,
+            'replicas': self.replicas
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'TimeWeightedValue':
+        accumulator = cls(data['start_time'], data['value'], data['window'])
+        accumulator.last_time = data['last_time']
+        accumulator.area = data['area']
+        accumulator.durations.update((value, duration) for value, duration in data['durations'])
+        accumulator.window_area.update((index, area) for index, area in data['window_area'])
+        accumulator.merged_time = data['merged_time']
+        accumulator.replicas = data['replicas']
+        return accumulator